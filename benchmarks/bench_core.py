@@ -0,0 +1,192 @@
+#
+# bench_core.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+"""
+Benchmark the plugin core against the stand-ins in standins.py
+
+    python benchmarks/bench_core.py --sizes 1000,10000,100000 --ops 1000
+
+For every queue size it reports latency percentiles, allocated blocks
+and journal bytes written per operation, for queue operations, the
+remove_priority status field after a change, and check_and_remove()
+cycles.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+# The plugin modules use implicit relative imports (from common import ...)
+sys.path.insert(0, os.path.join(ROOT, "queuedremove"))
+
+import deluge.configmanager
+from twisted.internet import defer, reactor
+
+from queuedremove.core import Core
+from standins import Session
+
+def allocated_blocks():
+    # Only available on Python >= 3.4
+    getallocatedblocks = getattr(sys, "getallocatedblocks", None)
+    return getallocatedblocks() if getallocatedblocks else 0
+
+class Recorder(object):
+    """Collect latency, allocations and persisted bytes per operation"""
+
+    def __init__(self, core):
+        self.core = core
+        self.samples = {} # name -> [(seconds, blocks, bytes)]
+
+    def journal_size(self):
+        journal = self.core.journal
+        journal.f.flush()
+        return os.path.getsize(journal.journal_file)
+
+    def measure(self, name, func, *args, **kwargs):
+        size = self.journal_size()
+        blocks = allocated_blocks()
+        start = time.time()
+        ret = func(*args, **kwargs)
+        elapsed = time.time() - start
+        blocks = allocated_blocks() - blocks
+        written = self.journal_size() - size
+        if written < 0:
+            # Rotated by a compaction, count the snapshot as written
+            written = self.journal_size() + os.path.getsize(self.core.journal.snapshot_file)
+        self.samples.setdefault(name, []).append((elapsed, blocks, written))
+        return ret
+
+    def report(self, title):
+        print(title)
+        print("  %-10s %8s %10s %10s %10s %10s %10s %10s" % (
+            "op", "count", "p50 ms", "p90 ms", "p99 ms", "max ms", "blocks", "bytes"))
+        for name in sorted(self.samples):
+            samples = self.samples[name]
+            latencies = sorted(s[0] for s in samples)
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+            print("  %-10s %8d %10.3f %10.3f %10.3f %10.3f %10.1f %10.1f" % (
+                name, len(samples), pct(0.5), pct(0.9), pct(0.99), latencies[-1] * 1000,
+                sum(s[1] for s in samples) / float(len(samples)),
+                sum(s[2] for s in samples) / float(len(samples)),
+            ))
+
+@defer.inlineCallbacks
+def bench(size, options):
+    config_dir = tempfile.mkdtemp(prefix="queuedremove-bench-")
+    deluge.configmanager.set_config_dir(config_dir)
+    session = Session(options.volumes, seed=options.seed)
+    session.install()
+    rand = session.random
+
+    tids = session.add_torrents(size, from_state=True)
+
+    core = Core.__new__(Core)
+    core.fs = session.fs
+    core.enable()
+    # The benchmark drives the checks itself
+    core.scheduler.stop()
+    rec = Recorder(core)
+
+    for i in tids:
+        rec.measure("add", core.add, i)
+
+    ops = (
+        ("top", core.queue_top),
+        ("bottom", core.queue_bottom),
+        ("forward", core.queue_forward),
+        ("back", core.queue_back),
+    )
+    for n in range(options.ops):
+        name, func = rand.choice(ops)
+        rec.measure(name, func, rand.choice(tids))
+        rec.measure("set", core.queue_set, rand.choice(tids), pos=rand.randrange(len(core.rq)))
+        rec.measure("status", core.snapshot.get, rand.choice(tids))
+
+    for n in range(min(options.ops, len(tids) // 2)):
+        tid = tids.pop(rand.randrange(len(tids)))
+        rec.measure("remove", core.remove, tid)
+
+    for n in range(options.checks):
+        # Drop every volume under the threshold, and refill the queue
+        for volume in session.fs.volumes():
+            session.fs.free[volume] = core.config["remove_threshold"] - 1
+        for dev in list(core.volumes.statvfs_cache):
+            core.volumes.expire(dev)
+        queued = core.rq.torrent_count()
+        rec.measure("check", core.check_and_remove)
+        yield core.removal.wait()
+        for i in session.add_torrents(queued - core.rq.torrent_count()):
+            core.add(i)
+
+    rec.report("%d queued torrents, %d volumes" % (size, options.volumes))
+
+    core.disable()
+    session.uninstall()
+    shutil.rmtree(config_dir)
+
+@defer.inlineCallbacks
+def main(options):
+    try:
+        for size in options.sizes:
+            yield bench(size, options)
+    finally:
+        reactor.stop()
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser()
+    parser.add_option("--sizes", default="1000,10000,100000",
+                      help="comma separated queue sizes [default: %default]")
+    parser.add_option("--ops", type="int", default=1000,
+                      help="reorder/remove operations per size [default: %default]")
+    parser.add_option("--checks", type="int", default=20,
+                      help="check_and_remove() cycles per size [default: %default]")
+    parser.add_option("--volumes", type="int", default=1,
+                      help="simulated volumes [default: %default]")
+    parser.add_option("--seed", type="int", default=0)
+    options, args = parser.parse_args()
+    options.sizes = [int(i) for i in options.sizes.split(",")]
+
+    reactor.callWhenRunning(main, options)
+    reactor.run()
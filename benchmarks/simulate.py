@@ -0,0 +1,498 @@
+#
+# simulate.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+"""
+Replay a trace of torrent activity against the plugin core, in simulated
+time, to tune thresholds and the removal policy offline
+
+    python benchmarks/simulate.py --generate 7 > week.trace
+    python benchmarks/simulate.py week.trace --set stop_threshold=20G
+    python benchmarks/simulate.py week.trace --jobs 8 \\
+        --sweep remove_threshold=1G,5G,10G --sweep check_interval_min=5,30,60
+
+The real Core runs on a twisted Clock against the stand-ins in standins.py,
+so days of activity replay in seconds. Deleting data takes no simulated
+time. Every parameter combination of --sweep runs in its own process.
+
+A trace has one json object per line, in time order, t in seconds:
+    {"t": 0, "free": [bytes, ...]}
+        free space of every volume, the first line sets the volume count
+    {"t": 5, "add": "<torrent_id>", "size": bytes, "rate": bytes/s, "volume": 0, "queue": true}
+        a torrent added to the session, downloading at rate (0: already
+        complete), queue also puts it at the bottom of the remove queue
+    {"t": 9, "queue": "<torrent_id>"}
+        put a torrent at the bottom of the remove queue
+    {"t": 9, "remove": "<torrent_id>"}
+        removed by the user
+    {"t": 9, "write": bytes, "volume": 0}
+        written by other programs (negative: deleted)
+
+Reported per run:
+    enospc           steps where a volume was full and writes failed
+    enospc_bytes     bytes which could not be written
+    near_misses      times free space fell below --margin (default: half
+                     of remove_threshold)
+    min_free         lowest free space seen
+    removed          torrents removed by the plugin
+    over_deleted     bytes freed beyond stop_threshold (plus the space
+                     downloads still need with reserve_demand)
+    per_hour         removals per simulated hour, mean and max
+    reactor          seconds spent in the plugin on the reactor, and the
+                     longest single call
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import tempfile
+import optparse
+import itertools
+import multiprocessing
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+# The plugin modules use implicit relative imports (from common import ...)
+sys.path.insert(0, os.path.join(ROOT, "queuedremove"))
+
+import deluge.configmanager
+from deluge.log import LOG as log
+from twisted.internet import defer, task
+from twisted.internet.task import Clock, LoopingCall
+
+from queuedremove.core import Core, DEFAULT_PREFS
+from standins import Session
+
+UNITS = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+
+def parse_value(value):
+    """1G -> 1073741824, true -> True, 5 -> 5, 0.5 -> 0.5, else the string"""
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    if value[-1:].upper() in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1:].upper()])
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+def format_bytes(n):
+    for unit in ("T", "G", "M", "K"):
+        if abs(n) >= UNITS[unit]:
+            return "%.1f%s" % (n / float(UNITS[unit]), unit)
+    return "%d" % n
+
+class SimulatedReactor(Clock):
+    """
+    A Clock which also runs callFromThread() calls at once, and measures
+    the time spent in the calls it runs, less the work done "in threads"
+    """
+
+    def __init__(self):
+        Clock.__init__(self)
+        self.busy = 0.0
+        self.longest = 0.0
+        self.threads = 0.0
+
+    def callLater(self, delay, f, *args, **kwargs):
+        return Clock.callLater(self, delay, self.timed, f, *args, **kwargs)
+
+    def callFromThread(self, f, *args, **kwargs):
+        f(*args, **kwargs)
+
+    def timed(self, f, *args, **kwargs):
+        start, threads = time.time(), self.threads
+        try:
+            return f(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start - (self.threads - threads)
+            self.busy += elapsed
+            self.longest = max(self.longest, elapsed)
+
+    def deferToThread(self, f, *args, **kwargs):
+        """Run at once, deleting data takes no simulated time"""
+        start = time.time()
+        try:
+            return defer.maybeDeferred(f, *args, **kwargs)
+        finally:
+            self.threads += time.time() - start
+
+class SimulatedTime(object):
+    """Stands for the time module where the plugin compares with now"""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def time(self):
+        return self.clock.seconds()
+
+class SimulatedTask(object):
+    """Cooperative tasks scheduled on the clock"""
+
+    TaskStopped = task.TaskStopped
+
+    def __init__(self, clock):
+        self.cooperator = task.Cooperator(scheduler=lambda f: clock.callLater(0, f))
+
+    def cooperate(self, iterator):
+        return self.cooperator.cooperate(iterator)
+
+    def coiterate(self, iterator):
+        return self.cooperator.coiterate(iterator)
+
+def run_on_clock(clock):
+    """Point the reactor, threads, tasks and time of the plugin modules to clock"""
+    package = os.path.realpath(os.path.dirname(sys.modules[Core.__module__].__file__))
+    class SimulatedLoopingCall(LoopingCall):
+        def __init__(self, f, *args, **kwargs):
+            LoopingCall.__init__(self, f, *args, **kwargs)
+            self.clock = clock
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None)
+        if not filename or os.path.realpath(os.path.dirname(filename)) != package:
+            continue
+        name = module.__name__.rsplit(".", 1)[-1]
+        replacements = {
+            "reactor": clock,
+            # Provides deferToThread()
+            "threads": clock,
+            "task": SimulatedTask(clock),
+            "LoopingCall": SimulatedLoopingCall,
+        }
+        # Durations measured by the metrics stay in real time
+        if name in ("scheduler", "volumes", "rules"):
+            replacements["time"] = SimulatedTime(clock)
+        for attr, value in replacements.items():
+            if hasattr(module, attr):
+                setattr(module, attr, value)
+
+def load_trace(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class Simulation(object):
+    """One replay of a trace with one set of parameters"""
+
+    def __init__(self, trace, params, max_step=30.0, margin=None, seed=0):
+        self.trace = trace
+        self.params = params
+        self.max_step = max_step
+
+        free = trace[0].get("free", [2 ** 40]) if trace else [2 ** 40]
+        self.clock = SimulatedReactor()
+        run_on_clock(self.clock)
+        self.config_dir = tempfile.mkdtemp(prefix="queuedremove-sim-")
+        deluge.configmanager.set_config_dir(self.config_dir)
+        self.session = Session(len(free), seed=seed)
+        for volume, n in zip(self.session.fs.volumes(), free):
+            self.session.fs.free[volume] = n
+        self.session.install()
+        # Plugin time spent handling torrent events counts as reactor time
+        emit = self.session.events.emit
+        self.session.events.emit = lambda *args: self.clock.timed(emit, *args)
+
+        self.core = Core.__new__(Core)
+        self.core.fs = self.session.fs
+        self.core.enable()
+        self.core.set_config(params)
+        # Nothing to lose in a simulation, spare the fsyncs
+        self.core.journal.flush_delay = 86400
+        self.session.events.emit("SessionStartedEvent")
+
+        self.margin = margin if margin is not None else self.core.config["remove_threshold"] // 2
+        # Removals by the plugin go through TorrentManager.remove() while the clock runs
+        self.removing = {} # volume -> bytes freed by the plugin in this step
+        self.removals = [] # simulated time of every removal
+        self.stepping = False
+        remove = self.session.torrentmanager.remove
+        def removed(tid, remove_data=False):
+            volume = self.session.torrentmanager.torrents[tid].status["save_path"]
+            free = self.session.fs.free[volume]
+            ret = remove(tid, remove_data)
+            if self.stepping:
+                self.removing[volume] = self.removing.get(volume, 0) + self.session.fs.free[volume] - free
+                self.removals.append(self.clock.seconds())
+            return ret
+        self.session.torrentmanager.remove = removed
+
+        self.stats = {
+            "enospc": 0,
+            "enospc_bytes": 0,
+            "near_misses": 0,
+            "min_free": min(free),
+            "over_deleted": 0,
+        }
+        self.below = set() # volumes under the margin
+
+    def close(self):
+        self.core.disable()
+        self.session.uninstall()
+        shutil.rmtree(self.config_dir, True)
+
+    def apply(self, event):
+        session, core = self.session, self.core
+        if "add" in event:
+            volume = session.fs.volumes()[event.get("volume", 0)]
+            if not event.get("rate") and event["size"] > session.fs.free[volume]:
+                # A complete torrent copied in, which does not fit
+                self.enospc(event["size"] - session.fs.free[volume])
+                return
+            tid = session.add_torrent(event["size"], event.get("files", 1), volume,
+                                      rate=event.get("rate", 0), tid=event["add"])
+            if event.get("queue"):
+                core.add(tid)
+        elif "queue" in event:
+            if event["queue"] in session.torrentmanager.torrents:
+                core.add(event["queue"])
+        elif "remove" in event:
+            if event["remove"] in session.torrentmanager.torrents:
+                session.torrentmanager.remove(event["remove"], remove_data=True)
+        elif "write" in event:
+            volume = session.fs.volumes()[event.get("volume", 0)]
+            n = event["write"]
+            if n > session.fs.free[volume]:
+                self.enospc(n - session.fs.free[volume])
+                n = session.fs.free[volume]
+            session.fs.free[volume] -= n
+        elif "free" in event:
+            for volume, n in zip(session.fs.volumes(), event["free"]):
+                session.fs.free[volume] = n
+
+    def enospc(self, short):
+        self.stats["enospc"] += 1
+        self.stats["enospc_bytes"] += short
+
+    def step(self, until):
+        """Download, then run the plugin, up to until"""
+        now = self.clock.seconds()
+        for volume, short in self.session.download(until - now).items():
+            self.enospc(short)
+        self.removing = {}
+        self.stepping = True
+        self.clock.advance(until - now)
+        self.stepping = False
+
+        fs, core = self.session.fs, self.core
+        for volume in fs.volumes():
+            free = fs.free[volume]
+            self.stats["min_free"] = min(self.stats["min_free"], free)
+            if free < self.margin:
+                if volume not in self.below:
+                    self.below.add(volume)
+                    self.stats["near_misses"] += 1
+            else:
+                self.below.discard(volume)
+            freed = self.removing.get(volume)
+            if freed:
+                dev = fs.device(volume)
+                target = core.volume_thresholds(dev)[1]
+                if core.config["reserve_demand"]:
+                    target += core.demand.demand(dev)
+                self.stats["over_deleted"] += max(0, min(freed, free - target))
+
+    def run(self, duration=None):
+        start = time.time()
+        end = duration if duration is not None else (self.trace[-1]["t"] if self.trace else 0)
+        events = iter(self.trace)
+        event = next(events, None)
+        while True:
+            now = self.clock.seconds()
+            while event is not None and event["t"] <= now:
+                self.clock.timed(self.apply, event)
+                event = next(events, None)
+            if now >= end:
+                break
+            until = min(now + self.max_step, end if event is None else event["t"])
+            calls = self.clock.getDelayedCalls()
+            if calls:
+                # Nothing is due before the next call, the clock ran the others
+                until = min(until, min(c.getTime() for c in calls))
+            self.step(until)
+
+        hours = max(self.clock.seconds() / 3600.0, 1e-9)
+        buckets = {}
+        for t in self.removals:
+            buckets[int(t // 3600)] = buckets.get(int(t // 3600), 0) + 1
+        wall = time.time() - start
+        return dict(self.stats, **{
+            "params": self.params,
+            "hours": hours,
+            "removed": len(self.removals),
+            "per_hour": len(self.removals) / hours,
+            "max_per_hour": max(buckets.values()) if buckets else 0,
+            "reactor_seconds": self.clock.busy,
+            "reactor_max_ms": self.clock.longest * 1000,
+            "thread_seconds": self.clock.threads,
+            "wall_seconds": wall,
+            "speedup": self.clock.seconds() / max(wall, 1e-9),
+        })
+
+_traces = {}
+
+def simulate(args):
+    """Run one simulation in a worker process, return its report"""
+    filename, params, options = args
+    if filename not in _traces:
+        _traces[filename] = load_trace(filename)
+    sim = Simulation(_traces[filename], params, options["max_step"], options["margin"], options["seed"])
+    try:
+        return sim.run(options["duration"])
+    finally:
+        sim.close()
+
+def generate(days, options, out=sys.stdout):
+    """Write a synthetic trace: Poisson torrent adds, log-normal sizes"""
+    rand = random.Random(options.seed)
+    free = [parse_value(options.free)] * options.volumes
+    out.write(json.dumps({"t": 0, "free": free}) + "\n")
+    t, n = 0.0, 0
+    end = days * 86400
+    while True:
+        t += rand.expovariate(options.adds_per_hour / 3600.0)
+        if t >= end:
+            break
+        n += 1
+        # Median 1.3 GiB
+        size = int(min(2 ** 37, rand.lognormvariate(21, 1.5)))
+        out.write(json.dumps({
+            "t": round(t, 3),
+            "add": "%040x" % n,
+            "size": size,
+            "rate": rand.choice((0, 2 ** 20, 5 * 2 ** 20, 20 * 2 ** 20)),
+            "volume": rand.randrange(options.volumes),
+            "queue": rand.random() < options.queued,
+        }) + "\n")
+
+def report(results, out=sys.stdout):
+    keys = sorted(set(k for r in results for k in r["params"]))
+    header = keys + ["enospc", "near_misses", "min_free", "removed", "per_hour",
+                     "max_per_hour", "over_deleted", "reactor_s", "reactor_max_ms", "speedup"]
+    rows = []
+    for r in results:
+        rows.append([str(r["params"].get(k, "")) for k in keys] + [
+            "%d" % r["enospc"], "%d" % r["near_misses"], format_bytes(r["min_free"]),
+            "%d" % r["removed"], "%.2f" % r["per_hour"], "%d" % r["max_per_hour"],
+            format_bytes(r["over_deleted"]), "%.2f" % r["reactor_seconds"],
+            "%.1f" % r["reactor_max_ms"], "%.0fx" % r["speedup"],
+        ])
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        out.write("  ".join(c.rjust(w) for c, w in zip(row, widths)) + "\n")
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] trace | --generate DAYS")
+    parser.add_option("--set", action="append", default=[], metavar="KEY=VALUE",
+                      help="set a plugin setting, e.g. stop_threshold=10G")
+    parser.add_option("--sweep", action="append", default=[], metavar="KEY=V1,V2,...",
+                      help="run every combination of these settings")
+    parser.add_option("--jobs", type="int", default=multiprocessing.cpu_count(),
+                      help="parallel simulations [default: %default]")
+    parser.add_option("--duration", type="float", default=None,
+                      help="simulated seconds [default: until the last event]")
+    parser.add_option("--max-step", type="float", default=30.0,
+                      help="longest simulated step in seconds [default: %default]")
+    parser.add_option("--margin", default=None,
+                      help="free space counted as a near miss [default: remove_threshold / 2]")
+    parser.add_option("--json", action="store_true", help="print reports as json lines")
+    parser.add_option("--seed", type="int", default=0)
+    group = optparse.OptionGroup(parser, "Synthetic traces")
+    group.add_option("--generate", type="float", metavar="DAYS",
+                     help="write a trace of DAYS to stdout instead")
+    group.add_option("--volumes", type="int", default=1, help="[default: %default]")
+    group.add_option("--free", default="2T", help="initial free space [default: %default]")
+    group.add_option("--adds-per-hour", type="float", default=20.0, help="[default: %default]")
+    group.add_option("--queued", type="float", default=0.9,
+                     help="fraction of the torrents queued when added [default: %default]")
+    parser.add_option_group(group)
+    options, args = parser.parse_args()
+
+    if options.generate is not None:
+        generate(options.generate, options)
+        return
+    if len(args) != 1:
+        parser.error("a trace file is required")
+
+    def parse(items):
+        ret = []
+        for item in items:
+            key, sep, value = item.partition("=")
+            if not sep or key not in DEFAULT_PREFS:
+                parser.error("unknown setting %r" % item)
+            ret.append((key, [parse_value(v) for v in value.split(",")]))
+        return ret
+    fixed = dict((k, v[0]) for k, v in parse(options.set))
+    sweep = parse(options.sweep)
+    combinations = []
+    for values in itertools.product(*[v for k, v in sweep]):
+        params = dict(fixed)
+        params.update(zip([k for k, v in sweep], values))
+        combinations.append(params)
+
+    log.setLevel(logging.WARNING)
+    run_options = {
+        "max_step": options.max_step,
+        "margin": parse_value(options.margin) if options.margin else None,
+        "duration": options.duration,
+        "seed": options.seed,
+    }
+    jobs = [(os.path.abspath(args[0]), params, run_options) for params in combinations]
+    if len(jobs) == 1 or options.jobs <= 1:
+        results = [simulate(job) for job in jobs]
+    else:
+        # Each simulation points the plugin modules of its process to its own clock
+        pool = multiprocessing.Pool(min(options.jobs, len(jobs)))
+        try:
+            results = pool.map(simulate, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    if options.json:
+        for r in results:
+            sys.stdout.write(json.dumps(r) + "\n")
+    else:
+        report(results)
+
+if __name__ == "__main__":
+    main()
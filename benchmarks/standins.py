@@ -0,0 +1,335 @@
+#
+# standins.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+"""
+In-process stand-ins for the Deluge components used by the plugin core,
+so Core can be driven without a running daemon.
+
+install() registers them in deluge.component, so the component proxy in
+queuedremove.common returns them.
+"""
+
+import random
+
+import deluge.component as _component
+
+BLOCK = 4096
+
+class StatResult(object):
+    __slots__ = ("st_dev", "st_ino", "st_size", "st_blocks", "st_nlink")
+
+    def __init__(self, dev, ino=0, size=0, nlink=1):
+        self.st_dev = dev
+        self.st_ino = ino
+        self.st_size = size
+        self.st_blocks = (size + 511) // 512
+        self.st_nlink = nlink
+
+class StatvfsResult(object):
+    __slots__ = ("f_bavail", "f_frsize")
+
+    def __init__(self, free):
+        self.f_bavail = free // BLOCK
+        self.f_frsize = BLOCK
+
+class SimulatedFS(object):
+    """
+    Volumes with a free space counter, and files which only exist as
+    entries in a dict. Save paths are "/sim/<volume>".
+    """
+
+    def __init__(self, volumes=1, free=2 ** 40):
+        self.free = dict(("/sim/vol%d" % i, free) for i in range(volumes))
+        self.files = {} # path -> StatResult
+        self.next_ino = 1
+        self.statvfs_calls = 0
+
+    def volumes(self):
+        return sorted(self.free)
+
+    def volume_of(self, path):
+        return "/".join(path.split("/")[:3])
+
+    def device(self, path):
+        return self.volumes().index(self.volume_of(path)) + 1
+
+    def create(self, path, size, link_to=None):
+        """Create a file (or a hard link to link_to) and consume its space"""
+        if link_to is not None:
+            st = self.files[link_to]
+            st.st_nlink += 1
+            self.files[path] = st
+            return
+        self.files[path] = StatResult(self.device(path), self.next_ino, size)
+        self.next_ino += 1
+        self.free[self.volume_of(path)] -= size
+
+    def write(self, path, size):
+        """Append size bytes to a file, return how many fit on its volume"""
+        st = self.files[path]
+        volume = self.volume_of(path)
+        size = max(0, min(size, self.free[volume]))
+        st.st_size += size
+        st.st_blocks = (st.st_size + 511) // 512
+        self.free[volume] -= size
+        return size
+
+    def unlink(self, path):
+        st = self.files.pop(path, None)
+        if st is None:
+            return
+        st.st_nlink -= 1
+        if not st.st_nlink:
+            self.free[self.volume_of(path)] += st.st_size
+
+    # The os functions the plugin uses
+    def stat(self, path):
+        st = self.files.get(path)
+        if st is not None:
+            return st
+        if self.volume_of(path) not in self.free:
+            raise OSError(2, "No such file or directory", path)
+        return StatResult(self.device(path))
+
+    lstat = stat
+
+    def statvfs(self, path):
+        self.statvfs_calls += 1
+        return StatvfsResult(max(0, self.free[self.volume_of(path)]))
+
+class FakeTorrent(object):
+    """
+    A torrent with a fixed file list and a few status fields
+    With a download rate, it starts empty and is written by Session.download()
+    """
+
+    def __init__(self, torrent_id, save_path, files, rate=0):
+        self.torrent_id = torrent_id
+        self.files = files # [(relative path, size)]
+        total = sum(size for path, size in files)
+        self.status = {
+            "name": torrent_id,
+            "save_path": save_path,
+            "total_wanted_done": 0 if rate else total,
+            "total_wanted": total,
+            "upload_payload_rate": 0,
+            "download_payload_rate": rate,
+            "ratio": 0.0,
+            "total_seeds": 0,
+            "seeding_time": 0,
+            "completed_time": 0,
+            "state": "Downloading" if rate else "Seeding",
+            "tracker_host": "",
+            "label": "",
+        }
+
+    def get_status(self, keys):
+        return dict((k, self.status.get(k)) for k in keys)
+
+    def get_files(self):
+        return [{"path": path, "size": size} for path, size in self.files]
+
+class FakeEventManager(object):
+    def __init__(self):
+        self.handlers = {}
+
+    def register_event_handler(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def deregister_event_handler(self, event, handler):
+        self.handlers[event].remove(handler)
+
+    def emit(self, event, *args):
+        """Emit an event by name and arguments, or a DelugeEvent"""
+        if not isinstance(event, str):
+            event, args = event.name, event.args
+        for handler in list(self.handlers.get(event, [])):
+            handler(*args)
+
+class FakeRPCServer(object):
+    def register_object(self, obj, name=None):
+        pass
+
+class FakeCorePluginManager(object):
+    def __init__(self):
+        self.status_fields = {}
+
+    def register_status_field(self, field, function):
+        self.status_fields[field] = function
+
+    def deregister_status_field(self, field):
+        del self.status_fields[field]
+
+class FakeTorrentManager(object):
+    def __init__(self, fs, events):
+        self.fs = fs
+        self.events = events
+        self.torrents = {}
+
+    def add(self, torrent, from_state=False):
+        save_path = torrent.status["save_path"]
+        done = torrent.status["total_wanted_done"] == torrent.status["total_wanted"]
+        for path, size in torrent.files:
+            self.fs.create(save_path + "/" + path, size if done else 0)
+        self.torrents[torrent.torrent_id] = torrent
+        self.events.emit("TorrentAddedEvent", torrent.torrent_id, from_state)
+
+    def remove(self, torrent_id, remove_data=False):
+        """
+        Remove a torrent, its files are unlinked right away in both cases
+        because the plugin deletes them itself after detaching
+        """
+        torrent = self.torrents.pop(torrent_id)
+        save_path = torrent.status["save_path"]
+        for path, size in torrent.files:
+            self.fs.unlink(save_path + "/" + path)
+        self.events.emit("TorrentRemovedEvent", torrent_id)
+        return True
+
+class FakeCore(object):
+    """Stands for the "Core" component"""
+
+    def __init__(self, fs, torrentmanager):
+        self.fs = fs
+        self.torrentmanager = torrentmanager
+        self.download_rate = 0
+
+    def get_free_space(self, path=None):
+        return self.fs.free[self.fs.volume_of(path or self.fs.volumes()[0])]
+
+    def get_torrent_status(self, torrent_id, keys, diff=False):
+        return self.torrentmanager.torrents[torrent_id].get_status(keys)
+
+    def get_torrents_status(self, filter_dict, keys, diff=False):
+        torrents = self.torrentmanager.torrents
+        return dict((i, torrents[i].get_status(keys)) for i in filter_dict["id"] if i in torrents)
+
+    def get_session_status(self, keys):
+        return dict((k, self.download_rate) for k in keys)
+
+class Session(object):
+    """All the stand-ins wired together"""
+
+    def __init__(self, volumes=1, free=2 ** 40, seed=0):
+        self.random = random.Random(seed)
+        self.fs = SimulatedFS(volumes, free)
+        self.events = FakeEventManager()
+        self.plugins = FakeCorePluginManager()
+        self.torrentmanager = FakeTorrentManager(self.fs, self.events)
+        self.core = FakeCore(self.fs, self.torrentmanager)
+        self.count = 0
+        self.downloading = {} # torrent_id -> FakeTorrent
+        self.events.register_event_handler("TorrentRemovedEvent", self.on_torrent_removed)
+
+    def install(self):
+        components = _component._ComponentRegistry.components
+        components["Core"] = self.core
+        components["TorrentManager"] = self.torrentmanager
+        components["EventManager"] = self.events
+        components["CorePluginManager"] = self.plugins
+
+    def uninstall(self):
+        components = _component._ComponentRegistry.components
+        for name in ("Core", "TorrentManager", "EventManager", "CorePluginManager"):
+            components.pop(name, None)
+
+    def add_torrent(self, size, files=1, volume=None, from_state=False, rate=0, tid=None):
+        """
+        Add a torrent of size bytes split over files, return its id
+        With a rate (bytes/s) it is downloaded by download()
+        """
+        self.count += 1
+        if tid is None:
+            tid = "%040x" % self.count
+        if volume is None:
+            volume = self.random.choice(self.fs.volumes())
+        per_file = size // files
+        torrent = FakeTorrent(tid, volume, [
+            ("%s/%d" % (tid, i), per_file) for i in range(files)
+        ], rate)
+        self.torrentmanager.add(torrent, from_state)
+        if rate:
+            self.downloading[tid] = torrent
+            self.core.download_rate += rate
+        return tid
+
+    def on_torrent_removed(self, tid):
+        torrent = self.downloading.pop(tid, None)
+        if torrent is not None:
+            self.core.download_rate -= torrent.status["download_payload_rate"]
+
+    def download(self, seconds):
+        """
+        Write seconds worth of data of every downloading torrent
+        Return {volume: bytes which did not fit}
+        """
+        short = {}
+        for tid, torrent in list(self.downloading.items()):
+            status = torrent.status
+            save_path = status["save_path"]
+            want = min(int(status["download_payload_rate"] * seconds),
+                       status["total_wanted"] - status["total_wanted_done"])
+            # Files are written in order
+            offset = status["total_wanted_done"]
+            for path, size in torrent.files:
+                if want <= 0:
+                    break
+                if offset >= size:
+                    offset -= size
+                    continue
+                n = min(want, size - offset)
+                written = self.fs.write(save_path + "/" + path, n)
+                status["total_wanted_done"] += written
+                want -= written
+                offset = 0
+                if written < n:
+                    short[save_path] = short.get(save_path, 0) + want
+                    break
+            if status["total_wanted_done"] == status["total_wanted"]:
+                del self.downloading[tid]
+                self.core.download_rate -= status["download_payload_rate"]
+                status["download_payload_rate"] = 0
+                status["state"] = "Seeding"
+                self.events.emit("TorrentFinishedEvent", tid)
+                self.events.emit("TorrentStateChangedEvent", tid, "Seeding")
+        return short
+
+    def add_torrents(self, count, min_size=2 ** 20, max_size=2 ** 33, from_state=False):
+        return [self.add_torrent(self.random.randint(min_size, max_size), from_state=from_state)
+                for i in range(count)]
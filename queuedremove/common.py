@@ -41,10 +41,30 @@ def get_resource(filename):
     import pkg_resources, os
     return pkg_resources.resource_filename("queuedremove", os.path.join("data", filename))
 
+try:
+    string_types = basestring
+except NameError:
+    # Python 3
+    string_types = str
+
+def atomic_write(filename, data):
+    """Write data to filename.new, fsync it, then rename it over filename"""
+    import os
+    tmp = filename + ".new"
+    f = open(tmp, "w")
+    try:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    finally:
+        f.close()
+    os.rename(tmp, filename)
+
 
 import deluge.component as _component
 # A Synactic Sugar to component.get()
-class component(Object):
-    def __getattribute__(self,attr):
+class _Component(object):
+    def __getattr__(self,attr):
         return _component.get(attr)
+component=_Component()
 
@@ -0,0 +1,223 @@
+#
+# coordinator.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import json
+import time
+import hashlib
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, coordination is not available
+    fcntl = None
+
+from deluge.log import LOG as log
+
+from common import atomic_write
+
+def plan_removals(offers, free_space, remove_threshold, stop_threshold):
+    """
+    Plan the removals on a shared volume from the queue heads of every instance
+
+    offers maps instance id -> {"in_flight", "demand", "groups"}, where groups
+    is [[bytes, [torrent_id, ...]], ...] in queue order. Instances take turns,
+    the top groups of all of them first, then the second ones, and so on,
+    until enough is freed.
+    Return (need, {instance id: [torrent_id, ...]}), ({}) if nothing to remove.
+    """
+    in_flight = sum(o["in_flight"] for o in offers.values())
+    projected = free_space + in_flight - sum(o["demand"] for o in offers.values())
+    if projected > remove_threshold:
+        return 0, {}
+    # The same as a single instance would do
+    need = max(stop_threshold - in_flight, remove_threshold - projected)
+    candidates = sorted(
+        (rank, iid, size, tids)
+        for iid, o in offers.items()
+        for rank, (size, tids) in enumerate(o["groups"])
+    )
+    assignments = {}
+    freed = 0
+    for rank, iid, size, tids in candidates:
+        if freed >= need:
+            break
+        assignments.setdefault(iid, []).extend(tids)
+        freed += size
+    return need, assignments
+
+class Coordinator(object):
+    """
+    Coordinate the removals of several daemons sharing a volume
+
+    Every instance publishes an offer, the head of its queue on the shared
+    volume, in a directory on that volume. The instance holding the flock()
+    on the leader file plans the removals for everybody from all the fresh
+    offers, and publishes the plan. Every instance then removes only what
+    the plan assigns to it, once. A new plan waits until the instances
+    assigned in the previous one published an offer after carrying it out,
+    so their data in flight is counted. An instance that has not published
+    for gone_after seconds is taken for dead: it is neither waited for nor
+    assigned anything.
+
+    Files (in directory):
+        leader                    flock()ed by the leader
+        offers/<sha1 of id>.json  {"id", "time", "executed", "in_flight", "demand", "groups"}
+        plan.json                 {"epoch", "time", "leader", "need", "assignments"}
+    """
+
+    def __init__(self, directory, instance_id, ttl=900, gone_after=900):
+        self.directory = directory
+        self.id = instance_id
+        # Offers and plans older than this are ignored
+        self.ttl = ttl
+        # Instances publish on every check, a few check intervals
+        self.gone_after = gone_after
+        self.offers_dir = os.path.join(directory, "offers")
+        self.offer_file = os.path.join(
+            self.offers_dir, hashlib.sha1(instance_id.encode("utf-8")).hexdigest() + ".json")
+        self.plan_file = os.path.join(directory, "plan.json")
+        self.lock_file = os.path.join(directory, "leader")
+        self.lock = None # the leader file, while leading
+        self.executed = 0 # epoch of the last plan carried out
+
+    def start(self):
+        if fcntl is None:
+            raise RuntimeError("Coordination needs fcntl.flock()")
+        if not os.path.isdir(self.offers_dir):
+            os.makedirs(self.offers_dir)
+        # Don't carry out a plan again after a restart
+        offer = self.read(self.offer_file)
+        if offer is not None:
+            self.executed = offer.get("executed", 0)
+
+    def stop(self):
+        self.resign()
+
+    def read(self, filename):
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    # Leader election
+    def is_leader(self):
+        """Become the leader if nobody is, return whether this instance is"""
+        if self.lock is not None:
+            return True
+        f = open(self.lock_file, "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            f.close()
+            return False
+        self.lock = f
+        log.info("Leading the removals on %s" % self.directory)
+        return True
+
+    def resign(self):
+        if self.lock is None:
+            return
+        fcntl.flock(self.lock.fileno(), fcntl.LOCK_UN)
+        self.lock.close()
+        self.lock = None
+
+    # Every instance
+    def publish(self, in_flight, demand, groups):
+        """Publish the queue head, [[bytes, [torrent_id, ...]], ...]"""
+        atomic_write(self.offer_file, json.dumps({
+            "id": self.id,
+            "time": time.time(),
+            "executed": self.executed,
+            "in_flight": in_flight,
+            "demand": demand,
+            "groups": groups,
+        }))
+
+    def assigned(self):
+        """Torrents the latest plan assigns to this instance, only once per plan"""
+        plan = self.read(self.plan_file)
+        if plan is None or plan["epoch"] <= self.executed:
+            return []
+        self.executed = plan["epoch"]
+        if time.time() - plan["time"] > self.ttl:
+            return []
+        return plan["assignments"].get(self.id, [])
+
+    # The leader
+    def offers(self):
+        """Fresh offers of every live instance, by id"""
+        now = time.time()
+        ttl = min(self.ttl, self.gone_after)
+        ret = {}
+        for name in os.listdir(self.offers_dir):
+            if not name.endswith(".json"):
+                continue
+            offer = self.read(os.path.join(self.offers_dir, name))
+            if offer is not None and now - offer["time"] <= ttl:
+                ret[offer["id"]] = offer
+        return ret
+
+    def plan(self, free_space, remove_threshold, stop_threshold):
+        """Publish and return a new plan, None if not needed or too early"""
+        offers = self.offers()
+        last = self.read(self.plan_file)
+        epoch = 0
+        if last is not None:
+            epoch = last["epoch"]
+            # Dead instances don't have offers here
+            pending = [i for i in last["assignments"]
+                       if i in offers and offers[i]["executed"] < epoch]
+            if pending and time.time() - last["time"] <= self.ttl:
+                return None
+        need, assignments = plan_removals(offers, free_space, remove_threshold, stop_threshold)
+        if not assignments:
+            return None
+        plan = {
+            "epoch": epoch + 1,
+            "time": time.time(),
+            "leader": self.id,
+            "need": need,
+            "assignments": assignments,
+        }
+        atomic_write(self.plan_file, json.dumps(plan))
+        log.info("Planned removals of %d bytes on %s: %s" % (need, self.directory,
+            ", ".join("%s: %d torrents" % (i, len(t)) for i, t in sorted(assignments.items()))))
+        return plan
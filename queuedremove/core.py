@@ -37,47 +37,228 @@
 #    statement from all source files in the program, then also delete it here.
 #
 
+import os
+import time
+import socket
+import itertools
+
 from deluge.log import LOG as log
 from deluge.plugins.pluginbase import CorePluginBase
-from common import component
+from common import component, string_types
 import deluge.configmanager
 from deluge.core.rpcserver import export
+from deluge.event import DelugeEvent
+from twisted.internet import defer, reactor
+from twisted.internet import task
+from twisted.internet.task import LoopingCall
+from journal import QueueJournal
+from scheduler import CheckScheduler
+from volumes import VolumeIndex
+from reclaim import ReclaimIndex
+from removal import RemovalPipeline
+from snapshot import PrioritySnapshot
+from metrics import Metrics, Profiler, timed
+from selection import select_groups
+from statuscache import StatusCache
+from rules import AutoEnqueue
+from demand import DemandTracker
+from queueview import QueueView
+from coordinator import Coordinator
 
 DEFAULT_PREFS = {
     "remove_threshold": 104857600, # 100 MiB
     "stop_threshold": 1073741824, # 1 GiB
+    "journal_flush_delay": 1, # seconds between fsync of the queue journal
+    "check_interval_min": 5, # seconds
+    "check_interval_max": 300, # seconds
+    # Per volume thresholds, {path_on_volume: {"remove_threshold": ..., "stop_threshold": ...}}
+    "volume_overrides": {},
+    "delete_concurrency": 2, # torrents having their data deleted at once
+    # Shrink large files gradually before unlinking them
+    "gentle_delete": False,
+    "gentle_delete_rate": 52428800, # 50 MiB/s
+    "gentle_delete_chunk": 67108864, # 64 MiB
+    # "priority": remove whole priorities from the top until stop_threshold
+    # "cost": pick the cheapest priorities among the first selection_window
+    "selection": "priority",
+    "selection_window": 16,
+    # Cost of removing a torrent, see torrent_cost()
+    "cost_weights": {"torrents": 1.0, "upload_rate": 1.0, "seeders": 1.0, "ratio": 1.0},
+    # Keep free space minus what downloads still need above remove_threshold
+    # Assumes sparse allocation: with full preallocation the space is
+    # already taken and would be counted twice
+    "reserve_demand": False,
+    "status_cache_interval": 30, # seconds between full refreshes of the status cache
+    # Put matching torrents into the queue automatically, see rules.Rule
+    # [{"name": ..., "ratio": 2.0, "tracker": "example\\.org", "position": "bottom"}, ...]
+    "auto_rules": [],
+    # Write metrics in the Prometheus text format, "" to disable
+    "metrics_file": "",
+    "metrics_interval": 60, # seconds
+    # Plan removals together with other daemons saving to the same volume,
+    # through files in this directory on it, "" to disable, see coordinator.py
+    "coordination_dir": "",
+    "coordination_id": "", # unique per daemon, "" for hostname:config_dir
+    "coordination_ttl": 900, # seconds before offers and plans are stale
+    # Only read once to migrate, the queue is persisted by QueueJournal
     "remove_queue": [] # [[torrent_id,...],[torrent_id,...],...]
 }
 
+# Kept by the plugin itself, can't be read or written through get_config()/set_config()
+STATE_PREFS = ("remove_queue",)
+
+class QueueChangedEvent(DelugeEvent):
+    """
+    Emitted after the queue changed, at most once per reactor iteration
+    """
+    def __init__(self, torrents, groups):
+        """
+        :param torrents: number of queued torrents
+        :param groups: number of priorities
+        """
+        self._args = [torrents, groups]
+
 class Core(CorePluginBase):
 
+    # Filesystem access of the volume and reclaim indexes
+    fs = os
+
+    # Queued torrents validated per reactor iteration by validate()
+    validate_batch = 100
+
     # Interfaces
     def enable(self):
         log.info("QueuedRemove plugin enabled")
 
         self.torrents = component.Core.torrentmanager.torrents
         self.config = deluge.configmanager.ConfigManager("queuedremove.conf", DEFAULT_PREFS)
-        component.EventManager.register_event_handler("TorrentRemovedEvent", self.post_torrent_remove)
-
-        # Remove queue, save to disk
-        self.rq=self.config["rq"]
-        # Remove priorities, only cached in memory
-        self.remove_priorities={}
+        # Bumped by set_config(), from the time so it never repeats across restarts
+        self.config_version=int(time.time()*1000)
+        self.metrics=Metrics()
+        self.profiler=Profiler()
+        # Status fields of the torrents, so checks don't call into every torrent
+        self.status=StatusCache(
+            self.torrents,
+            # Includes the status fields of other plugins, e.g. label
+            lambda tid,fields:component.Core.get_torrent_status(tid,fields),
+            lambda tids,fields:component.Core.get_torrents_status({"id":tids},fields)
+        )
 
-        # Register Torrent status field
+        component.EventManager.register_event_handler("TorrentAddedEvent", self.post_torrent_add)
+        component.EventManager.register_event_handler("TorrentRemovedEvent", self.post_torrent_remove)
+        component.EventManager.register_event_handler("SessionStartedEvent", self.post_session_started)
+        component.EventManager.register_event_handler("TorrentStorageMovedEvent", self.post_torrent_moved)
+        component.EventManager.register_event_handler("TorrentFinishedEvent", self.post_torrent_finished)
+        component.EventManager.register_event_handler("TorrentStateChangedEvent", self.post_torrent_state_changed)
+
+        # Remove queue, saved to disk as snapshot + journal
+        self.journal = QueueJournal(
+            deluge.configmanager.get_config_dir(),
+            flush_delay=self.config["journal_flush_delay"],
+            metrics=self.metrics
+        )
+        self.rq=self.journal.load(self.config["remove_queue"])
+        if self.config["remove_queue"]:
+            # Migrated into the snapshot, drop it from the config
+            self.config["remove_queue"]=[]
+            self.config.save()
+
+        # Register Torrent status field, and versioned priorities for the UIs
+        self.snapshot=PrioritySnapshot(self.rq)
+        self.rq.listeners.append(self.snapshot)
         component.CorePluginManager.register_status_field(
             "remove_priority",
-            lambda tid:self.remove_priorities.get(tid,"")
+            self.snapshot.get
+        )
+        # Pages of the queue for the UIs
+        self.view=QueueView(self.rq,self.snapshot,self.status)
+
+        # Queued torrents grouped by the volume they are saved on
+        self.volumes=VolumeIndex(self.get_save_path,self.rq.table,self.config["volume_overrides"],self.fs)
+        self.rq.listeners.append(self.volumes)
+        # Torrents already queued are indexed by validate() once the session started
+
+        # Data of removed torrents is deleted in threads
+        self.removal=RemovalPipeline(
+            os.path.join(deluge.configmanager.get_config_dir(),"queuedremove.deleting"),
+            lambda tid:component.TorrentManager.remove(tid,remove_data=False),
+            self.config["delete_concurrency"],
+            self.gentle_delete(),
+            # The state is saved as often as the queue journal is synced
+            self.config["journal_flush_delay"]
         )
+        # Deletions left by the last run are resumed once the session is loaded
+
+        # Files of all torrents in the session, to know the space really freed
+        self.reclaim=ReclaimIndex(self.get_files,self.fs)
+        self.session_started=False
+
+        # Queue torrents matching the rules, as their status changes
+        self.auto=AutoEnqueue(
+            self.config["auto_rules"],
+            self.status,
+            lambda tid:tid in self.rq,
+            self.auto_enqueue,
+            # Torrents taken out of the queue by hand, the rules leave them alone
+            os.path.join(deluge.configmanager.get_config_dir(),"queuedremove.excluded"),
+            self.config["journal_flush_delay"]
+        )
+        self.status.listeners.append(self.auto.on_change)
+        self.auto_apply=None
+        self.queue_event=None
+        self.queue_event_version=self.snapshot.version
+
+        # Bytes the downloads will still write, per volume
+        self.demand=DemandTracker(self.status,self.fs)
+        self.status.listeners.append(self.demand.on_change)
+
+        # Removals on a volume shared with other daemons
+        self.coordinator=None
+        self.coordination_dev=None
+        self.start_coordinator()
+
+        self.validating=None
+        if self.torrents:
+            # Enabled on a running session, nothing more to wait for
+            self.post_session_started()
+
+        # Check and remove more often as free space runs out
+        self.scheduler = CheckScheduler(
+            self.check_and_remove,
+            self.sample_disk_usage,
+            self.config["check_interval_min"],
+            self.config["check_interval_max"]
+        )
+        self.scheduler.start()
 
-        # Start a timer to check and remove once a minute
-        self.check_timer = LoopingCall(self.check_and_remove)
-        self.check_timer.start(60)
+        self.status_timer = LoopingCall(self.refresh_status)
+        self.status_timer.start(self.config["status_cache_interval"], now=False)
 
-    def disable(self):
+        self.metrics_timer = LoopingCall(self.write_metrics)
+        self.metrics_timer.start(self.config["metrics_interval"], now=False)
 
-        self.check_timer.stop()
+    def disable(self):
 
+        self.scheduler.stop()
+        self.metrics_timer.stop()
+        self.status_timer.stop()
+        if self.validating is not None:
+            self.validating.stop()
+        if self.auto_apply is not None and self.auto_apply.active():
+            self.auto_apply.cancel()
+        if self.queue_event is not None and self.queue_event.active():
+            self.queue_event.cancel()
+        self.stop_coordinator()
+        self.removal.close()
+        self.auto.close()
+        self.journal.close(self.rq)
+
+        component.EventManager.deregister_event_handler("TorrentAddedEvent", self.post_torrent_add)
+        component.EventManager.deregister_event_handler("TorrentRemovedEvent", self.post_torrent_remove)
+        component.EventManager.deregister_event_handler("SessionStartedEvent", self.post_session_started)
+        component.EventManager.deregister_event_handler("TorrentStorageMovedEvent", self.post_torrent_moved)
+        component.EventManager.deregister_event_handler("TorrentFinishedEvent", self.post_torrent_finished)
+        component.EventManager.deregister_event_handler("TorrentStateChangedEvent", self.post_torrent_state_changed)
         component.CorePluginManager.deregister_status_field("remove_priority")
 
         log.info("QueuedRemove plugin disabled")
@@ -87,194 +268,702 @@ class Core(CorePluginBase):
 
     @export
     def set_config(self, config):
-        """Sets the config dictionary"""
+        """Sets the config dictionary, unknown keys and the plugin state are ignored"""
         for key in config.keys():
+            if key not in DEFAULT_PREFS or key in STATE_PREFS:
+                log.warning("Ignore setting %s"%key)
+                continue
             self.config[key] = config[key]
         self.config.save()
+        self.config_version+=1
+
+        self.scheduler.min_interval=self.config["check_interval_min"]
+        self.scheduler.max_interval=self.config["check_interval_max"]
+        if self.coordinator is not None:
+            self.coordinator.gone_after=3*self.config["check_interval_max"]
+        self.volumes.set_overrides(self.config["volume_overrides"])
+        self.removal.gentle=self.gentle_delete()
+        self.removal.set_concurrency(self.config["delete_concurrency"])
+        if "auto_rules" in config:
+            self.auto.set_rules(self.config["auto_rules"])
+            self.auto.evaluate_all(list(self.status.rows))
+        if [k for k in ("coordination_dir","coordination_id","coordination_ttl") if k in config]:
+            self.stop_coordinator()
+            self.start_coordinator()
 
     @export
-    def get_config(self):
-        """Returns the config dictionary"""
-        return self.config.config
+    def get_config(self, if_version=None):
+        """
+        Returns the config dictionary, without the queue
+        With if_version, returns {"version", "modified"}, and "config" only
+        if it changed after if_version (pass 0 to fetch it the first time)
+        """
+        if if_version is None:
+            return self.settings()
+        if if_version==self.config_version:
+            return {"version":self.config_version,"modified":False}
+        return {"version":self.config_version,"modified":True,"config":self.settings()}
 
-    # Utilities
-    def get_rp_groups(self, *tids):
-        """Get Remove Priority Groups from tids"""
-        ret=[]
-        for i in tids:
-            rp=self.remove_priorities.get(i)
-            if not rp:
-                self.warning("Torrent %s is not in the queue"%i)
-                continue
-            if rp not in ret:
-                ret.append(rp)
+    @export
+    def get_volumes(self):
+        """Returns free space, thresholds and queued torrent count of every volume"""
+        ret={}
+        for dev in self.volumes.volumes():
+            remove_threshold,stop_threshold=self.volume_thresholds(dev)
+            ret[self.volumes.paths[dev]]={
+                "free_space":self.volumes.free_space(dev),
+                "remove_threshold":remove_threshold,
+                "stop_threshold":stop_threshold,
+                "queued":len(self.volumes.members[dev]),
+            }
         return ret
 
-    def remove_invalid_torrent(self):
-        """Remove invalid torrent from the remove queue"""
-        for i,p in enumerate(self.rq):
-            # Filter out invalid torrent_id
-            self.rq[i]=filter(lambda x: x in self.torrents, p)
-
-        # Filter out empty priority
-        self.rq=filter(lambda x: x!=[], self.rq)
+    @export
+    def get_demand(self):
+        """
+        Returns the remaining wanted bytes of the downloads on every volume,
+        and the headroom above remove_threshold once they are written
+        """
+        ret={}
+        for dev in set(self.demand.total)|set(self.volumes.volumes()):
+            path=self.volumes.paths.get(dev) or self.demand.paths[dev]
+            free_space=self.volumes.free_space(dev) if dev in self.volumes.paths else \
+                component.Core.get_free_space(path)
+            ret[path]={
+                "demand":self.demand.demand(dev),
+                "free_space":free_space,
+                "in_flight":self.removal.in_flight(dev),
+                "projected_headroom":self.projected_free_space(dev,free_space)-self.volume_thresholds(dev)[0],
+            }
+        return ret
 
-    def update_remove_priorities(self):
-        """Update remove_priorities list"""
-        rp={}
-        for i,p in enumerate(self.rq):
-            for j in p:
-                rp[j]=i
+    @export
+    def get_removal_status(self):
+        """Returns the number and bytes of torrents having their data deleted"""
+        return self.removal.status()
 
-        self.remove_priorities=rp
+    @export
+    def get_metrics(self):
+        """Returns the counters and histograms of the plugin"""
+        return self.metrics.as_dict()
 
-    def apply_queue_change(self):
-        """Apply a queue change"""
-        self.remove_invalid_torrent()
-        self.update_remove_priorities()
-        return self.config.save()
+    @export
+    def profile(self, seconds):
+        """Profile the plugin for some seconds, returns the stats of its functions"""
+        return self.profiler.run(seconds)
 
-    # Exports
     @export
-    def add(self, *tids, ascend=True):
+    def get_scheduler_status(self):
+        """Returns the last decision of the check scheduler"""
+        return self.scheduler.status
+
+    # Utilities
+    def settings(self):
+        return dict((k,v) for k,v in self.config.config.items() if k not in STATE_PREFS)
+
+    def gentle_delete(self):
+        """Return (chunk, rate) for RemovalPipeline, or None if disabled"""
+        if not self.config["gentle_delete"]:
+            return None
+        return self.config["gentle_delete_chunk"],self.config["gentle_delete_rate"]
+
+    def get_priority(self, tid):
+        """Get Remove Priority of a torrent, "" if not in the queue"""
+        rp=self.rq.priority(tid)
+        return "" if rp is None else rp
+
+    def get_rp_groups(self, tids, warn=log.warning):
         """
-        Add torrent(s) into the queue
-        if ascend is True, then the torrents will be assign ascending priorities
-        if False, the torrents will be assigned same priority
+        Get Remove Priority Groups from tids
+        Return one representative torrent_id per group, sorted by priority
+        """
+        ret={}
+        for i in tids:
+            rp=self.rq.priority(i)
+            if rp is None:
+                warn("Torrent %s is not in the queue"%i)
+                continue
+            ret.setdefault(rp,i)
+        return [ret[i] for i in sorted(ret)]
+
+    def validate(self):
         """
+        Remove invalid torrents from the remove queue, and index the volumes
+        of the others, in batches on the reactor
+        The head of the queue goes first, so the torrents indexed on a volume
+        are always the first ones queued on it, and checks running meanwhile
+        still remove in order.
+        Return a Deferred firing with the number of torrents removed.
+        """
+        if self.validating is not None:
+            self.validating.stop()
+        order=[i for group in self.rq for i in group]
+        invalid=[]
+        def work():
+            for n,i in enumerate(order):
+                if i in self.rq:
+                    if i not in self.torrents:
+                        # Empty priorities are pruned by the queue itself
+                        self.rq.discard(i)
+                        invalid.append(i)
+                    elif self.volumes.device_of(i) is None:
+                        self.volumes.index(i)
+                if n%self.validate_batch==self.validate_batch-1:
+                    yield None
+        def done(result):
+            self.validating=None
+            if invalid:
+                log.info("Removed %d invalid torrents from the queue"%len(invalid))
+                self.apply_queue_change()
+            return len(invalid)
+        def failed(failure):
+            if not failure.check(task.TaskStopped):
+                log.error("Failed to validate the queue: %s"%failure.getErrorMessage())
+        self.validating=task.cooperate(work())
+        # Also persist what was removed before being stopped
+        return self.validating.whenDone().addErrback(failed).addCallback(done)
 
-        # Don't worry about empty priority, 
-        # because this will be corrected during apply_queue_change()
-        self.rq.append([])
+    def apply_queue_change(self):
+        """
+        Apply a queue change
+        The queue is kept valid by the torrent events, so only persist it
+        """
+        self.snapshot.invalidate()
+        self.save_queue()
+        # Checks apply even when they changed nothing, don't make the UIs refetch
+        if self.snapshot.version!=self.queue_event_version and (
+                self.queue_event is None or not self.queue_event.active()):
+            self.queue_event_version=self.snapshot.version
+            self.queue_event=reactor.callLater(0,self.emit_queue_changed)
+        return True
+
+    def emit_queue_changed(self):
+        component.EventManager.emit(QueueChangedEvent(self.rq.torrent_count(),len(self.rq)))
+
+    @timed("save_seconds")
+    def save_queue(self):
+        self.journal.commit(self.rq)
+
+    def refresh_status(self, everything=False):
+        """
+        Refresh the status of the torrents whose fields change without an
+        event: the whole session if auto-enqueue rules watch it (or with
+        everything), otherwise the queued and the downloading ones
+        """
+        tids=None
+        if not everything and not self.auto.rules:
+            tids=set(self.demand.contrib)
+            tids.update(self.rq.torrents())
+        return self.status.refresh_all(tids).addCallback(lambda result:self.auto.tick())
+
+    def auto_enqueue(self, tid, rule):
+        """Put a torrent matching an auto-enqueue rule into the queue"""
+        if rule.position=="top":
+            self.rq.insert([tid],0)
+        elif rule.position=="bottom":
+            self.rq.insert([tid])
+        else:
+            self.rq.extend(rule.position,[tid])
+        self.metrics.inc("auto_enqueued")
+        # Apply once for all the torrents matched in this reactor iteration
+        if self.auto_apply is None or not self.auto_apply.active():
+            self.auto_apply=reactor.callLater(0,self.apply_queue_change)
+
+    def write_metrics(self):
+        if self.config["metrics_file"]:
+            self.metrics.write_prometheus(self.config["metrics_file"])
+
+    # Queue operations, the callers apply the change
+    def op_add(self, tids, ascend=True, warn=log.warning):
+        new=[]
         for i in tids:
-            if self.remove_priorities.get(i):
-                self.warning("Torrent %s already in queue with priority %d"%(
-                    i,self.remove_priorities[i]
+            if i not in self.torrents:
+                warn("Torrent %s does not exist"%i)
+                continue
+            if i in self.rq or i in new:
+                warn("Torrent %s already in queue with priority %s"%(
+                    i,self.get_priority(i)
                 ))
                 continue
             if ascend:
                 # Add to a new priority
-                self.rq.append([i])
+                self.rq.insert([i])
+            else:
+                new.append(i)
+        if new:
+            # Add to a new priority at the bottom, all together
+            self.rq.insert(new)
+
+    def op_remove(self, tids, warn=log.warning):
+        for i in tids:
+            # Empty priority will be pruned by the queue
+            if not self.rq.discard(i):
+                warn("Torrent %s is not in the queue"%i)
+            elif i in self.torrents:
+                # Taken out by hand, not because it left the session
+                self.auto.exclude(i)
+
+    def op_top(self, tids, warn=log.warning):
+        for i in reversed(self.get_rp_groups(tids,warn)):
+            self.rq.move(i,0)
+
+    def op_bottom(self, tids, warn=log.warning):
+        for i in self.get_rp_groups(tids,warn):
+            self.rq.move(i,len(self.rq))
+
+    def op_forward(self, tids, warn=log.warning):
+        # Don't let selected priorities jump over each other
+        top=0
+        for i in self.get_rp_groups(tids,warn):
+            rp=self.rq.priority(i)
+            if rp>top:
+                # Swap with the one before it
+                self.rq.move(i,rp-1)
+                top=rp
+            else:
+                top=rp+1
+
+    def op_back(self, tids, warn=log.warning):
+        bottom=len(self.rq)-1
+        for i in reversed(self.get_rp_groups(tids,warn)):
+            rp=self.rq.priority(i)
+            if rp<bottom:
+                # Swap with the one after it
+                self.rq.move(i,rp+1)
+                bottom=rp
             else:
-                # Add to the last priority
-                self.rq[-1].append(i)
+                bottom=rp-1
+
+    def op_set(self, tids, pos, warn=log.warning):
+        for i in tids:
+            if not self.rq.discard(i):
+                warn("Torrent %s is not in the queue"%i)
+
+        # Put all of tid into priority pos,
+        # or a new priority at the top/bottom if pos is out of range
+        self.rq.extend(pos,[i for i in tids if i in self.torrents])
 
+    # Exports
+    @export
+    @timed("queue_op_seconds")
+    def add(self, *tids, ascend=True):
+        """
+        Add torrent(s) into the queue
+        if ascend is True, then the torrents will be assign ascending priorities
+        if False, the torrents will be assigned same priority
+        """
+        self.op_add(tids,ascend)
         return self.apply_queue_change()
 
     @export
+    @timed("queue_op_seconds")
     def remove(self, *tids):
         """Remove torrent(s) from the queue"""
-        for i in tids:
-            rp=self.remove_priorities.get(i)
-            if not rp:
-                self.warning("Torrent %s is not in the queue"%i)
-                continue
-            # Remove the torrent from queue
-            self.rq[rp].remove(i)
-
+        self.op_remove(tids)
         return self.apply_queue_change()
 
     @export
+    @timed("queue_op_seconds")
     def queue_top(self, *tids):
         """Move torrent(s) and all the same torrents in the same priority to top of the queue"""
-        for i in reversed(get_rp_groups(*tids)):
-            tmp=self.rq[i]
-            del self.rq[i]
-            self.rq.insert(tmp)
-
+        self.op_top(tids)
         return self.apply_queue_change()
 
     @export
+    @timed("queue_op_seconds")
     def queue_bottom(self, *tids):
         """Move torrent(s) and all the same torrents in the same priority to bottom of the queue"""
-        for i in get_rp_groups(*tids):
-            tmp=self.rq[i]
-            del self.rq[i]
-            self.rq.append(tmp)
-
+        self.op_bottom(tids)
         return self.apply_queue_change()
 
     @export
+    @timed("queue_op_seconds")
     def queue_forward(self, *tids):
         """Move torrent(s) forward in the queue"""
-        for i in sorted(get_rp_groups(*tids)):
-            # Filter out the first one
-            if i!=0:
-                # Swap with the one before it
-                self.rq[i-1],self.rq[i]=self.rq[i],self.rq[i-1]
-
+        self.op_forward(tids)
         return self.apply_queue_change()
 
     @export
+    @timed("queue_op_seconds")
     def queue_back(self, *tids):
         """Move torrent(s) back in the queue"""
-        for i in reversed(sorted(get_rp_groups(*tids))):
-            # Filter out the last one
-            if i!=len(self.rq):
-                # Swap with the one after it
-                self.rq[i],self.rq[i+1]=self.rq[i+1],self.rq[i]
-
+        self.op_back(tids)
         return self.apply_queue_change()
 
     @export
+    @timed("queue_op_seconds")
     def queue_set(self, *tids, pos):
         """Force set torrent's(s') queue position"""
-        for i in tids:
-            rp=self.remove_priorities.get(i)
-            if not rp:
-                self.warning("Torrent %s is not in the queue"%i)
-                continue
-            self.rq[rp].remove(i)
-
-        # Put all of tid into self.rq[pos]
-        # Don't need to validate because apply_queue_change() will do it
-        if pos<0:
-            self.rq.insert(0,tids)
-        elif pos>len(self.rq):
-            self.rq.append(tids)
-        else:
-            self.rq[pos]+=tids
-
+        self.op_set(tids,pos)
         return self.apply_queue_change()
 
+    @export
+    @timed("queue_op_seconds")
+    def batch(self, ops):
+        """
+        Apply a list of queue operations in order, and persist them once
+        Every op is a dict {"op": name, "tids": [torrent_id,...]} where name
+        is one of add, remove, top, bottom, forward, back, set. add takes an
+        optional "ascend" (default True), set takes a "pos".
+        Nothing is applied if any op is malformed (ValueError).
+        Return a list of {"op": name, "warnings": [...]}, one per op.
+        """
+        handlers={
+            "add":self.op_add,
+            "remove":self.op_remove,
+            "top":self.op_top,
+            "bottom":self.op_bottom,
+            "forward":self.op_forward,
+            "back":self.op_back,
+            "set":self.op_set,
+        }
+
+        # Validate everything before touching the queue
+        if not isinstance(ops,(list,tuple)):
+            raise ValueError("ops must be a list")
+        for n,op in enumerate(ops):
+            if not isinstance(op,dict):
+                raise ValueError("Op %d: must be a dict"%n)
+            if op.get("op") not in handlers:
+                raise ValueError("Op %d: unknown operation %r"%(n,op.get("op")))
+            if not isinstance(op.get("tids"),(list,tuple)):
+                raise ValueError("Op %d: tids must be a list"%n)
+            if [i for i in op["tids"] if not isinstance(i,string_types)]:
+                raise ValueError("Op %d: torrent_ids must be strings"%n)
+            if op["op"]=="set" and (not isinstance(op.get("pos"),int) or isinstance(op["pos"],bool)):
+                raise ValueError("Op %d: set needs an integer pos"%n)
+            if op["op"]=="add" and not isinstance(op.get("ascend",True),bool):
+                raise ValueError("Op %d: ascend must be a bool"%n)
+
+        results=[]
+        for op in ops:
+            warnings=[]
+            kwargs={"warn":warnings.append}
+            if op["op"]=="add":
+                kwargs["ascend"]=op.get("ascend",True)
+            elif op["op"]=="set":
+                kwargs["pos"]=op["pos"]
+            handlers[op["op"]](op["tids"],**kwargs)
+            results.append({"op":op["op"],"warnings":warnings})
+
+        self.apply_queue_change()
+        return results
+
+    @export
+    def get_priorities(self, since=None):
+        """
+        Returns priorities of all the queued torrents,
+        or only those changed after version since
+        """
+        return self.snapshot.since(since)
+
+    @export
+    def get_queue(self, offset=0, limit=100, sort="priority", reverse=False, search="", since=None, known=()):
+        """
+        Returns a page of the queued torrents, see QueueView.page
+        Pass the version of the previous page as since and its ids as known
+        to only receive the rows which changed.
+        """
+        return self.view.page(offset,limit,sort,reverse,search,since,known)
+
+    @export
+    def reconcile(self):
+        """Check the whole queue against the session, return the number of torrents removed"""
+        return self.validate()
+
     # Triggers
+    def post_torrent_add(self,tid,*args):
+        """Trigger after add a torrent"""
+        # Torrents loaded with the session are indexed by reclaim.build()
+        if self.session_started:
+            self.status.refresh(tid)
+            self.reclaim.index(tid)
+
+    def post_session_started(self):
+        """Trigger after the session loaded all the torrents"""
+        log.debug("post_session_started")
+        self.session_started=True
+        # Forget the exclusions of torrents removed while we were not running
+        self.auto.prune(self.torrents)
+        self.removal.resume(self.torrents)
+        self.validate()
+        # Finds the downloading torrents, later refreshes only follow them
+        self.refresh_status(True)
+        self.reclaim.build(self.torrents)
+
     def post_torrent_remove(self,tid):
         """Trigger after remove a torrent"""
         log.debug("post_torrent_remove")
-        self.remove(tid)
+        self.reclaim.unindex(tid)
+        self.status.forget(tid)
+        self.demand.forget(tid)
+        self.auto.forget(tid)
+        if tid in self.rq:
+            self.remove(tid)
+
+    def post_torrent_moved(self,tid,path):
+        """Trigger after move storage of a torrent"""
+        self.status.refresh(tid)
+        if tid in self.rq:
+            self.volumes.index(tid)
+        if tid in self.reclaim:
+            self.reclaim.index(tid)
+
+    def post_torrent_state_changed(self,tid,state):
+        """Trigger after a torrent started, paused, etc."""
+        if tid in self.torrents:
+            self.status.refresh(tid)
+
+    def post_torrent_finished(self,tid):
+        """Trigger after a torrent finished downloading"""
+        self.status.refresh(tid)
+        if tid in self.reclaim:
+            self.reclaim.index(tid)
+
+    def get_save_path(self, tid):
+        return self.status.get(tid,"save_path")
+
+    def get_files(self, tid):
+        """Absolute paths of the files of a torrent"""
+        save_path=self.get_save_path(tid)
+        return [os.path.join(save_path,f["path"]) for f in self.torrents[tid].get_files()]
+
+    def torrent_cost(self, tid):
+        """
+        Seeding loss of removing a torrent: a constant per torrent, plus
+        its upload rate in MiB/s, plus more for few seeders or a low ratio
+        """
+        w=self.config["cost_weights"]
+        get=self.status.get
+        return (w.get("torrents",0)
+            +w.get("upload_rate",0)*get(tid,"upload_payload_rate")/1048576.0
+            +w.get("seeders",0)/(1.0+max(0,get(tid,"total_seeds")))
+            +w.get("ratio",0)/(1.0+max(0,get(tid,"ratio"))))
+
+    def volume_groups(self, dev):
+        """
+        Queued torrents on a volume grouped by priority, from the top,
+        an iterator of (priority, [torrent_id, ...])
+        Walks the queue in order, so stopping early is cheap
+        """
+        device=self.volumes.handle_device
+        tid=self.rq.table.tid
+        for rp,handles in enumerate(self.rq.handle_groups()):
+            tids=[tid(h) for h in handles if device(h)==dev]
+            tids=[i for i in tids if i in self.torrents]
+            if tids:
+                yield rp,tids
+
+    def removal_order(self, groups, need):
+        """Reorder groups, from volume_groups(), in the order to remove them"""
+        groups=iter(groups)
+        if self.config["selection"]!="cost":
+            return groups
+
+        head=list(itertools.islice(groups,self.config["selection_window"]))
+        candidates=[
+            (rp,self.reclaim.reclaimable(tids),sum(self.torrent_cost(i) for i in tids))
+            for rp,tids in head
+        ]
+        chosen=set(select_groups(candidates,need))
+        # The rest is only used if the chosen ones share files and free less
+        return itertools.chain(
+            [g for g in head if g[0] in chosen],
+            [g for g in head if g[0] not in chosen],
+            groups
+        )
 
-    def check_and_remove(self):
-        """Check if needed and do remove from the queue"""
+    def volume_thresholds(self, dev):
+        """Return (remove_threshold, stop_threshold) of a volume"""
+        return (
+            self.volumes.threshold(dev,"remove_threshold",self.config["remove_threshold"]),
+            self.volumes.threshold(dev,"stop_threshold",self.config["stop_threshold"])
+        )
+
+    def projected_free_space(self, dev, free_space):
+        """
+        Free space once the data being deleted is gone,
+        and the downloads wrote what they still need (if reserve_demand)
+        """
+        projected=free_space+self.removal.in_flight(dev)
+        if self.config["reserve_demand"]:
+            projected-=self.demand.demand(dev)
+        return projected
+
+    def sample_disk_usage(self):
+        """Return (smallest headroom above remove threshold, session download rate)"""
         log.debug("Checking remaining disk space")
-        free_space=component.Core.core.get_free_space()
+        headroom=None
+        for dev in self.volumes.volumes():
+            h=self.projected_free_space(dev,self.volumes.free_space(dev))-self.volume_thresholds(dev)[0]
+            if headroom is None or h<headroom:
+                headroom=h
+        status=component.Core.get_session_status(["payload_download_rate"])
+        return headroom,status["payload_download_rate"]
+
+    @timed("check_seconds")
+    def check_and_remove(self):
+        """Check every volume having queued torrents, remove from the queue if needed"""
+        self.metrics.inc("checks")
+        devs=self.volumes.volumes()
+        if self.coordinator is not None and self.coordination_dev not in devs:
+            # Lead and publish the offer even with nothing queued there
+            devs.append(self.coordination_dev)
+        for dev in devs:
+            self.check_and_remove_volume(dev)
 
-        log.debug("Free disk space: %s bytes"%free_space)
+        return self.apply_queue_change()
+
+    def check_and_remove_volume(self, dev):
+        """Check a volume and remove its torrents from the queue if needed"""
+        if self.coordinator is not None and dev==self.coordination_dev:
+            return self.check_and_remove_shared(dev)
+        remove_threshold,stop_threshold=self.volume_thresholds(dev)
+        free_space=self.volumes.free_space(dev)
+        in_flight=self.removal.in_flight(dev)
+        projected=self.projected_free_space(dev,free_space)
+        self.metrics.observe("free_space_bytes",free_space)
+
+        log.debug("Free disk space on %s: %s bytes, %s bytes being deleted, %s bytes projected"%(
+            self.volumes.paths[dev],free_space,in_flight,projected
+        ))
 
         # Check if disk space is above the remove threshold
-        if free_space>self.config["remove_threshold"]:
+        if projected>remove_threshold:
             log.debug("The disk space is above the threshold, do nothing")
             return True
 
-        log.info("The disk space is below the threshold, remove torrents in the queue")
-        
+        log.info("The disk space on %s is below the threshold, remove torrents in the queue"%self.volumes.paths[dev])
+
+        # Attention: don't use remaining disk space here due to disk space recycle latency
+        # Files shared with torrents not removed (cross-seeding, hard links)
+        # are not counted as freed
+        # Data still being deleted is already on its way to be freed
+        # Free at least stop_threshold, or enough for the downloads to fit
+        need=max(stop_threshold-in_flight,remove_threshold-projected)
+        plan=self.reclaim.plan()
+        chosen=[]
+        # Pick first, the queue can't change while walking it
+        for rp,tids in self.removal_order(self.volume_groups(dev),need):
+            if plan.freed>=need:
+                break
+            # Remove all torrents of this volume in the top priority
+            chosen.extend((i,plan.add(i)) for i in tids)
+
         # Check if the queue is empty
-        if self.rq=[]:
+        if not chosen and plan.freed<need:
             log.warning("The queue is empty, abort")
             return False
 
-        # Attention: don't use remaining disk space here due to disk space recycle latency
-        # FIXME: if some torrents share spaces, 
-        #        then the space actually recycled will be less than we calculated, 
-        #        but it's OK at most times because we will come back 1 minute later.
-        total_freed=0
-        while total_freed<self.config["stop_threshold"]:
-            rq_top=self.rq[0]
-            # Remove all torrents in the cell
-            for i in self.rq[0]
-                # this value is an upper bound of the space we freed
-                total_freed+=self.torrents[i].get_status("total_wanted_done")["total_wanted_done"]
-                component.TorrentManager.remove(i, remove_date=True)
-            del self.rq[0]
-
-        return self.apply_queue_change()
+        removals=[self.remove_torrent(dev,i,size) for i,size in chosen]
+        self.removed(dev,plan,removals,free_space)
+        return True
 
+    def remove_torrent(self, dev, tid, size):
+        """
+        Take a torrent out of the queue and remove it, size is what its
+        deletion frees, return the Deferred of its deletion
+        """
+        save_path,paths=self.get_save_path(tid),self.get_files(tid)
+        # Their st_nlink drops once the data is deleted
+        shared=self.reclaim.sharing(tid)
+        self.rq.discard(tid)
+        d=self.removal.remove(tid,save_path,paths,size,dev)
+        if shared:
+            def deleted(result):
+                self.reclaim.refresh(shared)
+                return result
+            d.addBoth(deleted)
+        return d
+
+    def removed(self, dev, plan, removals, free_space):
+        """Account for the removals from a volume having free_space before"""
+        self.volumes.expire(dev)
+        log.info("Removed %d torrents, %d bytes freed"%(len(plan.tids),plan.freed))
+
+        self.metrics.observe("removed_torrents",len(plan.tids))
+        self.metrics.observe("estimated_freed_bytes",plan.freed)
+        self.metrics.inc("removed_torrents_total",len(plan.tids))
+        self.metrics.inc("estimated_freed_bytes_total",plan.freed)
+        def deleted(result):
+            # Downloads in the meantime make this a lower bound
+            self.volumes.expire(dev)
+            freed=max(0,self.volumes.free_space(dev)-free_space)
+            self.metrics.observe("freed_bytes",freed)
+            self.metrics.inc("freed_bytes_total",freed)
+        defer.DeferredList(removals,consumeErrors=True).addCallback(deleted)
+
+    # Volume shared with other daemons
+    def start_coordinator(self):
+        directory=self.config["coordination_dir"]
+        if not directory:
+            return
+        instance=self.config["coordination_id"] or "%s:%s"%(
+            socket.gethostname(),deluge.configmanager.get_config_dir())
+        coordinator=Coordinator(directory,instance,self.config["coordination_ttl"],
+            3*self.config["check_interval_max"])
+        try:
+            coordinator.start()
+            dev=self.fs.stat(directory).st_dev
+        except (OSError,IOError,RuntimeError) as e:
+            log.error("Can't coordinate removals through %s: %s"%(directory,e))
+            return
+        self.coordinator=coordinator
+        self.coordination_dev=dev
+        # Checked even with nothing of ours queued there
+        self.volumes.paths.setdefault(dev,directory)
+        log.info("Coordinating removals through %s as %s"%(directory,instance))
+
+    def stop_coordinator(self):
+        if self.coordinator is not None:
+            self.coordinator.stop()
+        self.coordinator=None
+        self.coordination_dev=None
+
+    def queue_head(self, dev, size):
+        """
+        Queued torrents on a volume in removal order, [[bytes, [torrent_id, ...]], ...],
+        whole priorities until size bytes
+        """
+        head=[]
+        total=0
+        for rp,tids in self.removal_order(self.volume_groups(dev),size):
+            if total>=size:
+                break
+            freed=self.reclaim.reclaimable(tids)
+            head.append([freed,tids])
+            total+=freed
+        return head
+
+    def check_and_remove_shared(self, dev):
+        """
+        Check the volume shared with other daemons: plan for all of them if
+        leading, carry out our part of the latest plan, publish our queue head
+        """
+        remove_threshold,stop_threshold=self.volume_thresholds(dev)
+        free_space=self.volumes.free_space(dev)
+        self.metrics.observe("free_space_bytes",free_space)
+        coordinator=self.coordinator
+        try:
+            if coordinator.is_leader():
+                coordinator.plan(free_space,remove_threshold,stop_threshold)
+
+            # Skip what left the queue or moved since the plan
+            tids=[i for i in coordinator.assigned()
+                if i in self.rq and i in self.torrents and self.volumes.device_of(i)==dev]
+            if tids:
+                log.info("Removing %d torrents as planned on %s"%(len(tids),self.volumes.paths[dev]))
+                plan=self.reclaim.plan()
+                removals=[self.remove_torrent(dev,i,plan.add(i)) for i in tids]
+                self.removed(dev,plan,removals,free_space)
+
+            # Enough for the leader to free stop_threshold from our queue alone
+            coordinator.publish(
+                self.removal.in_flight(dev),
+                self.demand.demand(dev) if self.config["reserve_demand"] else 0,
+                self.queue_head(dev,stop_threshold+remove_threshold)
+            )
+        except (OSError,IOError) as e:
+            log.warning("Can't coordinate removals through %s: %s"%(coordinator.directory,e))
+            return False
+        return True
@@ -31,6 +31,221 @@ Copyright:
     statement from all source files in the program, then also delete it here.
 */
 
+Ext.ns('Deluge.queuedremove');
+
+/**
+ * A page of the remove queue
+ *
+ * Only the rows on the page are kept. Every poll passes the version and
+ * ids of the current page, so the core only sends the rows which changed.
+ */
+Deluge.queuedremove.QueuePanel = Ext.extend(Ext.grid.GridPanel, {
+
+	pageSize: 100,
+	pollInterval: 3000,
+
+	constructor: function(config) {
+		config = Ext.apply({
+			store: new Ext.data.JsonStore({
+				idProperty: 'id',
+				fields: [
+					'id', 'name', 'priority', 'size', 'ratio',
+					'upload_rate', 'seeds', 'state', 'save_path'
+				]
+			}),
+			columns: [
+				{id: 'priority', header: _('Priority'), dataIndex: 'priority', width: 60},
+				{id: 'name', header: _('Name'), dataIndex: 'name', width: 250},
+				{header: _('Size'), dataIndex: 'size', width: 80, renderer: fsize},
+				{header: _('Ratio'), dataIndex: 'ratio', width: 60,
+					renderer: function(v) { return v == null ? '' : v.toFixed(3); }},
+				{header: _('Up Speed'), dataIndex: 'upload_rate', width: 80, renderer: fspeed},
+				{header: _('Seeders'), dataIndex: 'seeds', width: 60},
+				{header: _('State'), dataIndex: 'state', width: 80},
+				{header: _('Save Path'), dataIndex: 'save_path', width: 200}
+			],
+			autoExpandColumn: 'name',
+			enableColumnMove: false,
+			enableHdMenu: false,
+			stripeRows: true,
+			tbar: [{
+				text: _('Top'),
+				iconCls: 'icon-top',
+				handler: this.onQueueOp.createDelegate(this, ['top'])
+			}, {
+				text: _('Up'),
+				iconCls: 'icon-up',
+				handler: this.onQueueOp.createDelegate(this, ['forward'])
+			}, {
+				text: _('Down'),
+				iconCls: 'icon-down',
+				handler: this.onQueueOp.createDelegate(this, ['back'])
+			}, {
+				text: _('Bottom'),
+				iconCls: 'icon-bottom',
+				handler: this.onQueueOp.createDelegate(this, ['bottom'])
+			}, '-', {
+				text: _('Remove'),
+				iconCls: 'icon-remove',
+				handler: this.onQueueOp.createDelegate(this, ['remove'])
+			}, '->', {
+				xtype: 'textfield',
+				ref: '../searchField',
+				emptyText: _('Search'),
+				enableKeyEvents: true,
+				listeners: {
+					keyup: {fn: this.onSearch, scope: this, buffer: 300}
+				}
+			}],
+			bbar: [{
+				iconCls: 'x-tbar-page-prev',
+				ref: '../prevButton',
+				handler: this.onPrev,
+				scope: this
+			}, {
+				xtype: 'tbtext',
+				ref: '../pageText',
+				text: ''
+			}, {
+				iconCls: 'x-tbar-page-next',
+				ref: '../nextButton',
+				handler: this.onNext,
+				scope: this
+			}]
+		}, config);
+		Deluge.queuedremove.QueuePanel.superclass.constructor.call(this, config);
+
+		this.offset = 0;
+		this.total = 0;
+		this.sort = 'priority';
+		this.reverse = false;
+		this.search = '';
+		this.version = null;
+		this.ids = [];
+		this.rows = {};
+		this.on('headerclick', this.onHeaderClick, this);
+	},
+
+	start: function() {
+		this.reset();
+		this.task = Ext.TaskMgr.start({
+			run: this.update,
+			scope: this,
+			interval: this.pollInterval
+		});
+	},
+
+	stop: function() {
+		if (this.task) {
+			Ext.TaskMgr.stop(this.task);
+			this.task = null;
+		}
+	},
+
+	// Forget the page, the next update fetches every row
+	reset: function() {
+		this.version = null;
+		this.ids = [];
+		this.rows = {};
+	},
+
+	update: function() {
+		if (this.updating) return;
+		this.updating = true;
+		deluge.client.queuedremove.get_queue(this.offset, this.pageSize,
+			this.sort, this.reverse, this.search, this.version, this.ids, {
+			success: this.onPage,
+			failure: function() { this.updating = false; },
+			scope: this
+		});
+	},
+
+	onPage: function(page) {
+		this.updating = false;
+		this.version = page.version;
+		this.total = page.total;
+
+		var rows = {};
+		Ext.each(page.ids, function(id) {
+			rows[id] = page.rows[id] || this.rows[id];
+		}, this);
+		this.ids = page.ids;
+		this.rows = rows;
+
+		if (page.modified) {
+			var sm = this.getSelectionModel(), store = this.getStore();
+			var selected = Ext.pluck(sm.getSelections(), 'id'), data = [];
+			Ext.each(page.ids, function(id) {
+				data.push(Ext.apply({id: id}, rows[id]));
+			});
+			store.loadData(data);
+			Ext.each(selected, function(id) {
+				var index = store.indexOfId(id);
+				if (index >= 0) sm.selectRow(index, true);
+			});
+		}
+
+		var last = Math.min(this.offset + this.pageSize, this.total);
+		this.pageText.setText(String.format(_('{0} - {1} of {2} ({3} priorities)'),
+			this.total ? this.offset + 1 : 0, last, this.total, page.groups));
+		this.prevButton.setDisabled(this.offset <= 0);
+		this.nextButton.setDisabled(last >= this.total);
+	},
+
+	onPrev: function() {
+		this.offset = Math.max(0, this.offset - this.pageSize);
+		this.update();
+	},
+
+	onNext: function() {
+		this.offset += this.pageSize;
+		this.update();
+	},
+
+	onSearch: function(field) {
+		this.search = field.getValue();
+		this.offset = 0;
+		this.update();
+	},
+
+	onHeaderClick: function(grid, index) {
+		// Every column is a sort key of the core
+		var sort = this.getColumnModel().getDataIndex(index);
+		this.reverse = this.sort == sort ? !this.reverse : false;
+		this.sort = sort;
+		this.offset = 0;
+		this.update();
+	},
+
+	// The whole selection in one call
+	onQueueOp: function(op) {
+		var ids = Ext.pluck(this.getSelectionModel().getSelections(), 'id');
+		if (!ids.length) return;
+		deluge.client.queuedremove.batch([{op: op, tids: ids}], {
+			success: this.update,
+			scope: this
+		});
+	}
+});
+
+Deluge.queuedremove.QueueWindow = Ext.extend(Ext.Window, {
+
+	constructor: function(config) {
+		config = Ext.apply({
+			title: _('Remove Queue'),
+			layout: 'fit',
+			width: 750,
+			height: 450,
+			closeAction: 'hide',
+			iconCls: 'x-deluge-remove-window-icon',
+			items: [new Deluge.queuedremove.QueuePanel()]
+		}, config);
+		Deluge.queuedremove.QueueWindow.superclass.constructor.call(this, config);
+		this.on('show', function() { this.items.get(0).start(); }, this);
+		this.on('hide', function() { this.items.get(0).stop(); }, this);
+	}
+});
+
 QueuedRemovePlugin = Ext.extend(Deluge.Plugin, {
 	constructor: function(config) {
 		config = Ext.apply({
@@ -40,11 +255,49 @@ QueuedRemovePlugin = Ext.extend(Deluge.Plugin, {
 	},
 
 	onDisable: function() {
-
+		deluge.toolbar.remove(this.separator);
+		deluge.toolbar.remove(this.button);
+		deluge.menus.torrent.remove(this.menu);
+		if (this.window) this.window.destroy();
 	},
 
 	onEnable: function() {
+		this.separator = deluge.toolbar.add('-');
+		this.button = deluge.toolbar.add({
+			text: _('Remove Queue'),
+			iconCls: 'icon-remove',
+			handler: this.onShowQueue,
+			scope: this
+		});
+		var item = function(text, op) {
+			return {
+				text: text,
+				handler: function() {
+					deluge.client.queuedremove.batch([{
+						op: op,
+						tids: deluge.torrents.getSelectedIds()
+					}]);
+				}
+			};
+		};
+		this.menu = deluge.menus.torrent.add({
+			text: _('Remove Queue'),
+			menu: new Ext.menu.Menu({
+				items: [
+					item(_('Add'), 'add'),
+					item(_('Top'), 'top'),
+					item(_('Up'), 'forward'),
+					item(_('Down'), 'back'),
+					item(_('Bottom'), 'bottom'),
+					item(_('Remove'), 'remove')
+				]
+			})
+		});
+	},
 
+	onShowQueue: function() {
+		if (!this.window) this.window = new Deluge.queuedremove.QueueWindow();
+		this.window.show();
 	}
 });
 new QueuedRemovePlugin();
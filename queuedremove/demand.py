@@ -0,0 +1,103 @@
+#
+# demand.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+
+from deluge.log import LOG as log
+
+class DemandTracker(object):
+    """
+    Remaining wanted bytes of the downloading torrents, per volume
+
+    Listens to the StatusCache, so a torrent's demand is only recomputed
+    when its state, progress or save path changes.
+    """
+
+    fields = set(["state", "total_wanted", "total_wanted_done", "save_path"])
+    # States which will still write to the disk
+    states = set(["Downloading", "Checking", "Allocating"])
+
+    def __init__(self, status, fs=os):
+        self.status = status
+        self.fs = fs
+        self.devices = {} # save_path -> device
+        self.paths = {} # device -> save_path
+        self.contrib = {} # torrent_id -> (device, bytes)
+        self.total = {} # device -> bytes
+
+    def device(self, path):
+        dev = self.devices.get(path)
+        if dev is None:
+            try:
+                dev = self.fs.stat(path).st_dev
+            except OSError as e:
+                log.warning("Can't stat %s: %s" % (path, e))
+                return None
+            self.devices[path] = dev
+            self.paths[dev] = path
+        return dev
+
+    def on_change(self, tid, changed):
+        """StatusCache listener"""
+        if self.fields.intersection(changed):
+            self.update(tid)
+
+    def update(self, tid):
+        self.forget(tid)
+        get = self.status.get
+        if get(tid, "state") not in self.states:
+            return
+        remaining = (get(tid, "total_wanted") or 0) - (get(tid, "total_wanted_done") or 0)
+        dev = self.device(get(tid, "save_path"))
+        if remaining <= 0 or dev is None:
+            return
+        self.contrib[tid] = (dev, remaining)
+        self.total[dev] = self.total.get(dev, 0) + remaining
+
+    def forget(self, tid):
+        old = self.contrib.pop(tid, None)
+        if old is None:
+            return
+        dev, remaining = old
+        self.total[dev] -= remaining
+        if not self.total[dev]:
+            del self.total[dev]
+
+    def demand(self, dev):
+        return self.total.get(dev, 0)
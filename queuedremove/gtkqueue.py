@@ -0,0 +1,305 @@
+#
+# gtkqueue.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import gtk
+
+from deluge.log import LOG as log
+from deluge.ui.client import client
+from deluge.ui.gtkui.torrentdetails import Tab
+import deluge.common
+
+class QueueModel(gtk.GenericTreeModel):
+    """
+    Lazy list model of the remove queue, in queue order
+
+    Only the number of queued torrents is known up front. Rows are fetched
+    from the core a page at a time, the first time the view asks for them,
+    and at most max_pages pages are kept. refresh() fetches only the rows
+    of a page which changed since it was fetched.
+    """
+
+    columns = (
+        ("id", str),
+        ("priority", int),
+        ("name", str),
+        ("size", str),
+        ("ratio", str),
+        ("upload_rate", str),
+        ("seeds", int),
+        ("state", str),
+    )
+
+    page_size = 200
+    max_pages = 20
+    # Row count changes larger than this reattach the model to its views
+    # instead of signalling every row
+    max_signals = 1000
+
+    def __init__(self):
+        gtk.GenericTreeModel.__init__(self)
+        # Rows are referenced by their index
+        self.props.leak_references = False
+        self.count = 0
+        self.pages = {} # page number -> {"version", "ids", "rows"}
+        self.used = [] # page numbers, least recently used first
+        self.fetching = set()
+        # Called with the new row count instead of signalling large changes
+        self.reattach = None
+
+    # GenericTreeModel
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY
+
+    def on_get_n_columns(self):
+        return len(self.columns)
+
+    def on_get_column_type(self, n):
+        return self.columns[n][1]
+
+    def on_get_iter(self, path):
+        return path[0] if path[0] < self.count else None
+
+    def on_get_path(self, index):
+        return (index,)
+
+    def on_get_value(self, index, column):
+        row = self.row(index)
+        if row is None:
+            # Not fetched yet
+            return self.columns[column][1]()
+        return row[column]
+
+    def on_iter_next(self, index):
+        return index + 1 if index + 1 < self.count else None
+
+    def on_iter_children(self, index):
+        return 0 if index is None and self.count else None
+
+    def on_iter_has_child(self, index):
+        return False
+
+    def on_iter_n_children(self, index):
+        return self.count if index is None else 0
+
+    def on_iter_nth_child(self, index, n):
+        return n if index is None and n < self.count else None
+
+    def on_iter_parent(self, index):
+        return None
+
+    # Pages
+    def row(self, index, fetch=True):
+        """Row at index, None if its page is not fetched yet"""
+        n, i = divmod(index, self.page_size)
+        page = self.pages.get(n)
+        if page is None:
+            if fetch and n not in self.fetching:
+                self.fetch(n)
+            return None
+        if i >= len(page["rows"]):
+            return None
+        return page["rows"][i]
+
+    def tid(self, index):
+        row = self.row(index, False)
+        return row and row[0]
+
+    def fetch(self, n):
+        page = self.pages.get(n)
+        since, known = (page["version"], page["ids"]) if page else (None, [])
+        self.fetching.add(n)
+        client.queuedremove.get_queue(
+            n * self.page_size, self.page_size, "priority", False, "", since, known
+        ).addCallback(self.on_page, n).addErrback(self.on_error, n)
+
+    def on_error(self, failure, n):
+        self.fetching.discard(n)
+        log.error("Failed to fetch the remove queue: %s" % failure.getErrorMessage())
+
+    def on_page(self, result, n):
+        self.fetching.discard(n)
+        old = self.pages.get(n)
+        if old is not None and not result["modified"]:
+            # Rows after this page may still have come or gone
+            old["version"] = result["version"]
+            self.set_count(result["total"])
+            return
+        rows = []
+        known = dict(zip(old["ids"], old["rows"])) if old else {}
+        for tid in result["ids"]:
+            if tid in result["rows"]:
+                rows.append(self.format(tid, result["rows"][tid]))
+            else:
+                rows.append(known[tid])
+
+        self.pages[n] = {"version": result["version"], "ids": result["ids"], "rows": rows}
+        if n in self.used:
+            self.used.remove(n)
+        self.used.append(n)
+        while len(self.used) > self.max_pages:
+            del self.pages[self.used.pop(0)]
+
+        self.set_count(result["total"])
+        old_rows = old["rows"] if old else []
+        for i, row in enumerate(rows):
+            index = n * self.page_size + i
+            if index >= self.count:
+                break
+            if i >= len(old_rows) or old_rows[i] != row:
+                self.row_changed((index,), self.get_iter((index,)))
+
+    def format(self, tid, row):
+        return (
+            tid,
+            row["priority"],
+            row["name"] or tid,
+            deluge.common.fsize(row["size"]) if row["size"] is not None else "",
+            "%.3f" % row["ratio"] if row["ratio"] is not None else "",
+            deluge.common.fspeed(row["upload_rate"]) if row["upload_rate"] else "",
+            row["seeds"] or 0,
+            row["state"] or "",
+        )
+
+    def set_count(self, count):
+        if count == self.count:
+            return
+        if abs(count - self.count) > self.max_signals and self.reattach is not None:
+            self.reattach(count)
+            return
+        while self.count < count:
+            self.count += 1
+            path = (self.count - 1,)
+            self.row_inserted(path, self.get_iter(path))
+        while self.count > count:
+            self.count -= 1
+            self.row_deleted((self.count,))
+
+    def refresh(self, first, last):
+        """Fetch the changes of the pages of rows first..last, drop the others"""
+        wanted = set(range(first // self.page_size, last // self.page_size + 1))
+        for n in list(self.pages):
+            if n not in wanted:
+                del self.pages[n]
+                self.used.remove(n)
+        for n in wanted:
+            if n not in self.fetching:
+                self.fetch(n)
+
+class QueueTab(Tab):
+    """Torrent details tab listing the whole remove queue"""
+
+    def __init__(self, menu):
+        Tab.__init__(self)
+        self._name = "Remove Queue"
+        self._tab_label = gtk.Label(_("Remove Queue"))
+        self.menu = menu
+
+        self.model = QueueModel()
+        self.model.reattach = self.reattach
+        self.view = gtk.TreeView()
+        # Only the visible rows are asked for
+        self.view.set_fixed_height_mode(True)
+        self.view.get_selection().set_mode(gtk.SELECTION_MULTIPLE)
+        self.view.set_rubber_banding(True)
+        for n, (title, width) in enumerate((
+            (_("Priority"), 60),
+            (_("Name"), 300),
+            (_("Size"), 80),
+            (_("Ratio"), 60),
+            (_("Up Speed"), 80),
+            (_("Seeders"), 60),
+            (_("State"), 90),
+        )):
+            column = gtk.TreeViewColumn(title, gtk.CellRendererText(), text=n + 1)
+            column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+            column.set_fixed_width(width)
+            column.set_resizable(True)
+            self.view.append_column(column)
+        self.view.set_model(self.model)
+        self.view.connect("button-press-event", self.on_button_press_event)
+
+        self._child_widget = gtk.ScrolledWindow()
+        self._child_widget.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        self._child_widget.add(self.view)
+        self._child_widget.show_all()
+
+        # The first page also tells the row count
+        self.model.fetch(0)
+        client.register_event_handler("QueueChangedEvent", self.on_queue_changed)
+
+    def disable(self):
+        client.deregister_event_handler("QueueChangedEvent", self.on_queue_changed)
+
+    def update(self):
+        """Called periodically while the tab is shown, refresh the visible rows"""
+        visible = self.view.get_visible_range()
+        if visible is None:
+            self.model.refresh(0, 0)
+        else:
+            self.model.refresh(visible[0][0], visible[1][0])
+
+    def clear(self):
+        pass
+
+    def reattach(self, count):
+        self.view.set_model(None)
+        self.model.count = count
+        self.view.set_model(self.model)
+
+    def on_queue_changed(self, torrents, groups):
+        self.model.set_count(torrents)
+        if self.view.flags() & gtk.MAPPED:
+            self.update()
+
+    def on_button_press_event(self, widget, event):
+        if event.button != 3:
+            return False
+        path = self.view.get_path_at_pos(int(event.x), int(event.y))
+        if path is None:
+            return False
+        selection = self.view.get_selection()
+        if not selection.path_is_selected(path[0]):
+            selection.unselect_all()
+            selection.select_path(path[0])
+        self.menu.popup(None, None, None, event.button, event.time)
+        return True
+
+    def get_selected_torrents(self):
+        model, paths = self.view.get_selection().get_selected_rows()
+        return [i for i in (self.model.tid(p[0]) for p in paths) if i]
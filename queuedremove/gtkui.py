@@ -46,30 +46,117 @@ from common import component
 import deluge.common
 
 from common import get_resource
+from gtkqueue import QueueTab
 
 class GtkUI(GtkPluginBase):
     def enable(self):
         self.glade = gtk.glade.XML(get_resource("config.glade"))
+        self.config = {}
+        self.config_version = 0
 
         component.Preferences.add_page("QueuedRemove", self.glade.get_widget("prefs_box"))
         component.PluginManager.register_hook("on_apply_prefs", self.on_apply_prefs)
         component.PluginManager.register_hook("on_show_prefs", self.on_show_prefs)
 
+        self.builder = gtk.Builder()
+        self.builder.add_from_file(get_resource("context_menu.glade"))
+        get = self.builder.get_object
+        get("change_menu_priority").set_submenu(get("priority_menu"))
+
+        # Queue tab, its menu acts on the selection of the tab
+        self.tab = QueueTab(get("change_menu"))
+        component.TorrentDetails.add_tab(self.tab)
+        for name, op in (
+            ("priority_menu_top", "top"),
+            ("priority_menu_up", "forward"),
+            ("priority_menu_down", "back"),
+            ("priority_menu_bottom", "bottom"),
+            ("change_menu_remove", "remove"),
+        ):
+            get(name).connect("activate", self.on_queue_op, op)
+        get("priority_menu_set").connect("activate", self.on_set_priority)
+
+        # Torrent menu of the main window, acts on the selected torrents
+        get("add_single_menu_add").connect("activate", self.on_add, True)
+        get("add_multiple_menu_add_same").connect("activate", self.on_add, False)
+        get("add_multiple_menu_add_ascending").connect("activate", self.on_add, True)
+        self.menuitem = gtk.MenuItem(_("Remove Queue"))
+        self.menuitem.show()
+        torrentmenu = component.MenuBar.torrentmenu
+        torrentmenu.append(self.menuitem)
+        self.menu_handler = torrentmenu.connect("show", self.on_torrentmenu_show)
+
     def disable(self):
         component.Preferences.remove_page("QueuedRemove")
         component.PluginManager.deregister_hook("on_apply_prefs", self.on_apply_prefs)
         component.PluginManager.deregister_hook("on_show_prefs", self.on_show_prefs)
 
+        self.tab.disable()
+        component.TorrentDetails.remove_tab(self.tab.get_name())
+        torrentmenu = component.MenuBar.torrentmenu
+        torrentmenu.disconnect(self.menu_handler)
+        torrentmenu.remove(self.menuitem)
+
     def on_apply_prefs(self):
         log.debug("applying prefs for QueuedRemove")
+        get = self.glade.get_widget
         config = {
-            "test":self.glade.get_widget("txt_test").get_text()
+            "remove_threshold": get("spin_remove_threshold").get_value_as_int() * 1048576,
+            "stop_threshold": get("spin_stop_threshold").get_value_as_int() * 1048576,
+            "reserve_demand": get("chk_reserve_demand").get_active(),
+            "gentle_delete": get("chk_gentle_delete").get_active(),
         }
         client.queuedremove.set_config(config)
 
     def on_show_prefs(self):
-        client.queuedremove.get_config().addCallback(self.cb_get_config)
+        # The core only sends the config again if it changed
+        client.queuedremove.get_config(self.config_version).addCallback(self.cb_get_config)
 
-    def cb_get_config(self, config):
+    def cb_get_config(self, result):
         "callback for on show_prefs"
-        self.glade.get_widget("txt_test").set_text(config["test"])
+        if result["modified"]:
+            self.config = result["config"]
+            self.config_version = result["version"]
+        get = self.glade.get_widget
+        get("spin_remove_threshold").set_value(self.config["remove_threshold"] // 1048576)
+        get("spin_stop_threshold").set_value(self.config["stop_threshold"] // 1048576)
+        get("chk_reserve_demand").set_active(self.config["reserve_demand"])
+        get("chk_gentle_delete").set_active(self.config["gentle_delete"])
+
+    # Menus, every action is one call for the whole selection
+    def on_torrentmenu_show(self, menu):
+        tids = component.TorrentView.get_selected_torrents()
+        if len(tids) > 1:
+            submenu = self.builder.get_object("add_multiple_menu")
+        else:
+            submenu = self.builder.get_object("add_single_menu")
+        if self.menuitem.get_submenu() is not submenu:
+            self.menuitem.set_submenu(submenu)
+
+    def on_add(self, widget, ascend):
+        tids = component.TorrentView.get_selected_torrents()
+        if tids:
+            client.queuedremove.batch([{"op": "add", "tids": tids, "ascend": ascend}])
+
+    def on_queue_op(self, widget, op):
+        tids = self.tab.get_selected_torrents()
+        if tids:
+            client.queuedremove.batch([{"op": op, "tids": tids}])
+
+    def on_set_priority(self, widget):
+        tids = self.tab.get_selected_torrents()
+        if not tids:
+            return
+        dialog = gtk.Dialog(
+            _("Set Priority"), component.MainWindow.window,
+            gtk.DIALOG_MODAL | gtk.DIALOG_DESTROY_WITH_PARENT,
+            (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL, gtk.STOCK_OK, gtk.RESPONSE_OK)
+        )
+        spin = gtk.SpinButton(gtk.Adjustment(0, 0, 2 ** 31 - 1, 1, 10))
+        spin.set_activates_default(True)
+        dialog.vbox.pack_start(spin)
+        dialog.set_default_response(gtk.RESPONSE_OK)
+        dialog.show_all()
+        if dialog.run() == gtk.RESPONSE_OK:
+            client.queuedremove.batch([{"op": "set", "tids": tids, "pos": spin.get_value_as_int()}])
+        dialog.destroy()
@@ -0,0 +1,216 @@
+#
+# journal.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import json
+import base64
+import time
+
+from deluge.log import LOG as log
+from twisted.internet import reactor, threads
+
+from common import atomic_write
+from removequeue import RemoveQueue
+
+# 1: "queue" is a list of groups of torrent_ids
+# 2: "ids" is base64 of the 20 byte binary ids, "sizes" the group sizes
+SNAPSHOT_VERSION = 2
+
+class QueueJournal(object):
+    """
+    Write-behind persistence of the remove queue
+
+    Every queue mutation is appended to the journal as one json line and
+    written out immediately, so a daemon crash loses nothing (the same as
+    saving the config every time did). fsync() is batched on a short timer,
+    and the journal is compacted into a snapshot in a thread once it grows
+    too large.
+
+    Files (in the config dir):
+        queuedremove.queue        snapshot {"version", "seq", "ids", "sizes"}
+        queuedremove.journal      [seq, op, args] per line
+        queuedremove.journal.old  journal being compacted
+    """
+
+    def __init__(self, config_dir, flush_delay=1.0, compact_size=1048576, metrics=None):
+        self.snapshot_file = os.path.join(config_dir, "queuedremove.queue")
+        self.journal_file = os.path.join(config_dir, "queuedremove.journal")
+        self.old_file = self.journal_file + ".old"
+        self.flush_delay = flush_delay
+        self.compact_size = compact_size
+        self.metrics = metrics
+
+        self.seq = 0
+        self.f = None
+        self.flush_timer = None
+        self.compacting = None
+
+    # Loading
+    def load(self, fallback=()):
+        """
+        Load the snapshot and replay the journal(s) on it
+        fallback is used when there is no snapshot yet (old config format)
+        """
+        rq, self.seq = None, 0
+        self.torn = False
+        if os.path.exists(self.snapshot_file):
+            snapshot = json.load(open(self.snapshot_file))
+            version = snapshot.get("version")
+            if version == 1:
+                rq = RemoveQueue(snapshot["queue"])
+            elif version == 2:
+                rq = RemoveQueue.unpack(base64.b64decode(snapshot["ids"]), snapshot["sizes"])
+            else:
+                raise ValueError("Unknown queue snapshot version %s" % version)
+            self.seq = snapshot["seq"]
+        if rq is None:
+            rq = RemoveQueue(fallback)
+        replayed = 0
+        for filename in (self.old_file, self.journal_file):
+            replayed += self.replay(rq, filename)
+        log.debug("Loaded %d priorities from the queue snapshot, replayed %d operations" % (len(rq), replayed))
+
+        rq.listeners.append(self.append)
+        self.f = open(self.journal_file, "a")
+        # Fold the replayed journal(s) into a fresh snapshot, and never
+        # append after a torn entry
+        if replayed or self.torn or not os.path.exists(self.snapshot_file):
+            self.compact(rq)
+        return rq
+
+    def replay(self, rq, filename):
+        if not os.path.exists(filename):
+            return 0
+        count = 0
+        for line in open(filename):
+            if not line.endswith("\n"):
+                self.torn = True
+            try:
+                seq, op, args = json.loads(line)
+            except ValueError:
+                # A torn write at the tail, everything before it is fine
+                log.warning("Ignore broken journal entry in %s" % filename)
+                self.torn = True
+                break
+            if seq <= self.seq:
+                continue
+            getattr(rq, op)(*args)
+            self.seq = seq
+            count += 1
+        return count
+
+    # Writing
+    def append(self, op, args):
+        """Queue listener, record one operation"""
+        self.seq += 1
+        self.f.write(json.dumps([self.seq, op, args]) + "\n")
+
+    def commit(self, rq):
+        """End of a queue change, push it to the OS and schedule a fsync"""
+        self.f.flush()
+        if self.flush_timer is None or not self.flush_timer.active():
+            self.flush_timer = reactor.callLater(self.flush_delay, self.flush, rq)
+
+    def flush(self, rq=None):
+        """fsync the journal, and compact it if it is too large"""
+        start = time.time()
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        if self.metrics is not None:
+            self.metrics.observe("fsync_seconds", time.time() - start)
+        if rq is not None and self.compacting is None and self.f.tell() > self.compact_size:
+            self.compact_in_thread(rq)
+
+    def rotate(self, rq):
+        """Take a snapshot of rq and start a new journal after it"""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        if os.path.exists(self.old_file):
+            # Left by a failed compaction, not in any snapshot yet
+            with open(self.journal_file) as f:
+                data = f.read()
+            with open(self.old_file, "a") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.remove(self.journal_file)
+        else:
+            os.rename(self.journal_file, self.old_file)
+        self.f = open(self.journal_file, "a")
+        data, sizes = rq.pack()
+        ids = base64.b64encode(data)
+        return json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "seq": self.seq,
+            "ids": ids if isinstance(ids, str) else ids.decode("ascii"),
+            "sizes": sizes,
+        })
+
+    def compact(self, rq):
+        """Snapshot rq and drop the journal synchronously"""
+        atomic_write(self.snapshot_file, self.rotate(rq))
+        os.remove(self.old_file)
+
+    def compact_in_thread(self, rq):
+        """Snapshot rq on the reactor, write it and drop the journal in a thread"""
+        log.debug("Compacting the queue journal")
+        data = self.rotate(rq)
+        def write():
+            atomic_write(self.snapshot_file, data)
+            os.remove(self.old_file)
+        def done(result):
+            self.compacting = None
+            return result
+        def failed(failure):
+            # The old journal is kept and replayed on the next load
+            log.error("Failed to compact the queue journal: %s" % failure.getErrorMessage())
+        self.compacting = threads.deferToThread(write)
+        return self.compacting.addErrback(failed).addBoth(done)
+
+    def close(self, rq):
+        """Flush everything and leave a fresh snapshot behind"""
+        if self.flush_timer is not None and self.flush_timer.active():
+            self.flush_timer.cancel()
+        if self.compacting is None:
+            self.compact(rq)
+        else:
+            self.flush()
+        self.f.close()
+        self.f = None
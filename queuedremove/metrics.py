@@ -0,0 +1,178 @@
+#
+# metrics.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import time
+import pstats
+import cProfile
+import functools
+
+from deluge.log import LOG as log
+from twisted.internet import defer, reactor
+
+from common import atomic_write
+
+INF = float("inf")
+SECONDS = (0.0001, 0.001, 0.01, 0.1, 1, 10, INF)
+BYTES = tuple(4 ** i * 1048576 for i in range(11)) + (INF,) # 1 MiB .. 1 PiB
+COUNTS = (0, 1, 2, 5, 10, 100, 1000, INF)
+
+class Histogram(object):
+    """Cumulative bucket counts, count and sum, like Prometheus' histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def as_dict(self):
+        return {
+            "buckets": [(str(b), c) for b, c in zip(self.buckets, self.counts)],
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+class Metrics(object):
+    """Counters and histograms of the plugin"""
+
+    histogram_types = {
+        "check_seconds": SECONDS,
+        "free_space_bytes": BYTES,
+        "estimated_freed_bytes": BYTES,
+        "freed_bytes": BYTES,
+        "removed_torrents": COUNTS,
+        "queue_op_seconds": SECONDS,
+        "save_seconds": SECONDS,
+        "fsync_seconds": SECONDS,
+    }
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = dict((name, Histogram(buckets))
+                               for name, buckets in self.histogram_types.items())
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        self.histograms[name].observe(value)
+
+    def as_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "histograms": dict((name, h.as_dict()) for name, h in self.histograms.items()),
+        }
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text format"""
+        lines = []
+        for name in sorted(self.counters):
+            lines.append("# TYPE queuedremove_%s counter" % name)
+            lines.append("queuedremove_%s %s" % (name, self.counters[name]))
+        for name in sorted(self.histograms):
+            h = self.histograms[name]
+            lines.append("# TYPE queuedremove_%s histogram" % name)
+            for bound, count in zip(h.buckets, h.counts):
+                le = "+Inf" if bound == INF else repr(bound)
+                lines.append('queuedremove_%s_bucket{le="%s"} %d' % (name, le, count))
+            lines.append("queuedremove_%s_sum %s" % (name, h.sum))
+            lines.append("queuedremove_%s_count %d" % (name, h.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        """Write the metrics for the node exporter textfile collector"""
+        try:
+            atomic_write(filename, self.prometheus())
+        except (IOError, OSError) as e:
+            log.warning("Can't write metrics to %s: %s" % (filename, e))
+
+def timed(name):
+    """Observe the duration of a method into self.metrics histogram name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = time.time()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.metrics.observe(name, time.time() - start)
+        return wrapper
+    return decorator
+
+class Profiler(object):
+    """Profile the reactor thread for a while, keep the plugin's functions"""
+
+    def __init__(self):
+        self.profile = None
+
+    def run(self, seconds, limit=50):
+        """Return a Deferred fired with the stats after seconds"""
+        if self.profile is not None:
+            return defer.fail(RuntimeError("Already profiling"))
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        d = defer.Deferred()
+        reactor.callLater(seconds, self.stop, d, limit)
+        return d
+
+    def stop(self, d, limit):
+        profile, self.profile = self.profile, None
+        profile.disable()
+
+        package = os.path.dirname(os.path.abspath(__file__))
+        ret = []
+        for (filename, line, func), (cc, nc, tt, ct, callers) in pstats.Stats(profile).stats.items():
+            if not os.path.abspath(filename).startswith(package):
+                continue
+            ret.append({
+                "function": "%s:%d(%s)" % (os.path.basename(filename), line, func),
+                "calls": nc,
+                "total_time": tt,
+                "cumulative_time": ct,
+            })
+        ret.sort(key=lambda x: x["cumulative_time"], reverse=True)
+        d.callback(ret[:limit])
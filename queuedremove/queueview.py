@@ -0,0 +1,175 @@
+#
+# queueview.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+class QueueView(object):
+    """
+    Paged, sorted and filtered view of the queue for the UIs
+
+    A page lists the torrent_ids shown and carries the rows of only those
+    the client does not know yet, or which changed since the version of
+    its last poll. Pages in queue order are read from the queue directly;
+    other orders and searches are computed once per version.
+    """
+
+    # sort key -> status field
+    sort_fields = {
+        "priority": None,
+        "name": "name",
+        "size": "total_wanted",
+        "ratio": "ratio",
+        "upload_rate": "upload_payload_rate",
+        "seeds": "total_seeds",
+        "state": "state",
+        "save_path": "save_path",
+    }
+
+    max_limit = 1000
+
+    def __init__(self, rq, snapshot, status):
+        self.rq = rq
+        self.snapshot = snapshot
+        self.status = status
+        self.cache = None # (key, ordered torrent_ids)
+
+    def version(self):
+        self.snapshot.refresh()
+        return [self.snapshot.version, self.status.version]
+
+    def loaded(self, tid):
+        # False if queued but not loaded into the session (yet)
+        return tid in self.status or tid in self.status.torrents
+
+    def column(self, field, tids):
+        loaded = [i for i in tids if self.loaded(i)]
+        values = dict(zip(loaded, self.status.column(field, loaded)))
+        return [values.get(i) for i in tids]
+
+    def row(self, tid, rp):
+        if self.loaded(tid):
+            get = lambda f: self.status.get(tid, f)
+        else:
+            get = lambda f: None
+        return {
+            "name": get("name"),
+            "priority": rp,
+            "size": get("total_wanted"),
+            "ratio": get("ratio"),
+            "upload_rate": get("upload_payload_rate"),
+            "seeds": get("total_seeds"),
+            "state": get("state"),
+            "save_path": get("save_path"),
+        }
+
+    def order(self, sort, reverse, search):
+        """All queued torrent_ids matching search, sorted"""
+        key = (sort, reverse, search, tuple(self.version()))
+        if self.cache is not None and self.cache[0] == key:
+            return self.cache[1]
+        tids = [i for g in self.rq for i in g]
+        if search:
+            names = self.column("name", tids)
+            tids = [i for i, n in zip(tids, names) if n and search in n.lower()]
+        if sort != "priority":
+            values = self.column(self.sort_fields[sort], tids)
+            # None sorts before everything, also on py3. Stable, so
+            # equal values stay in queue order
+            keys = [(v is not None, v) for v in values]
+            tids = [tids[n] for n in sorted(
+                range(len(tids)), key=keys.__getitem__, reverse=reverse
+            )]
+        elif reverse:
+            tids.reverse()
+        self.cache = (key, tids)
+        return tids
+
+    def page(self, offset=0, limit=100, sort="priority", reverse=False, search="", since=None, known=()):
+        """
+        Return {"version", "modified", "total", "groups", "offset", "ids", "rows"}
+        rows maps torrent_id -> row for the ids not in known or changed
+        after since, a version from an earlier page. modified is False if
+        the page is the same as known.
+        """
+        if sort not in self.sort_fields:
+            raise ValueError("Unknown sort key %r" % sort)
+        offset = max(0, int(offset))
+        limit = max(0, min(int(limit), self.max_limit))
+        search = (search or "").lower()
+        self.snapshot.refresh()
+
+        if sort == "priority" and not search:
+            total = self.rq.torrent_count()
+            if reverse:
+                start = max(0, total - offset - limit)
+                items = self.rq.page(start, max(0, total - offset - start))[::-1]
+            else:
+                items = self.rq.page(offset, limit)
+            ids = [i for i, rp in items]
+            priorities = dict(items)
+        else:
+            order = self.order(sort, reverse, search)
+            total = len(order)
+            ids = order[offset:offset + limit]
+            priorities = dict((i, self.rq.priority(i)) for i in ids)
+
+        known_ids, known = known, set(known)
+        if since is None or len(since) != 2 or since[1] > self.status.version:
+            send = ids
+        else:
+            delta = self.snapshot.since(since[0])
+            if delta["full"]:
+                send = ids
+            else:
+                changed_at = self.status.changed_at
+                send = [
+                    i for i in ids
+                    if i not in known or i in delta["priorities"]
+                    or changed_at.get(i, 0) > since[1]
+                ]
+
+        rows = dict((i, self.row(i, priorities[i])) for i in send)
+        return {
+            # After reading the rows, which may load them into the cache
+            "version": self.version(),
+            "modified": bool(rows) or ids != list(known_ids),
+            "total": total,
+            "groups": len(self.rq),
+            "offset": offset,
+            "ids": ids,
+            "rows": rows,
+        }
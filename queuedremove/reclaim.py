@@ -0,0 +1,159 @@
+#
+# reclaim.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+
+from deluge.log import LOG as log
+from twisted.internet import task
+
+class ReclaimIndex(object):
+    """
+    Map files on disk to the torrents referencing them
+
+    Every file is identified by (device, inode), so hard links and files
+    shared by several torrents are counted once, and only when every link
+    to it goes away. files_of(tid) returns the absolute paths of the files
+    of a torrent.
+    """
+
+    def __init__(self, files_of, fs=os):
+        self.files_of = files_of
+        # Provides lstat()
+        self.fs = fs
+        self.torrents = {} # torrent_id -> {(dev, ino): links}
+        self.inodes = {} # (dev, ino) -> [allocated bytes, st_nlink, {torrent_id: links}]
+
+    def __contains__(self, tid):
+        return tid in self.torrents
+
+    def index(self, tid):
+        """(Re)index the files of a torrent"""
+        self.unindex(tid)
+        keys = {}
+        for path in self.files_of(tid):
+            try:
+                st = self.fs.lstat(path)
+            except OSError:
+                # Not downloaded yet or already gone
+                continue
+            key = (st.st_dev, st.st_ino)
+            keys[key] = keys.get(key, 0) + 1
+            inode = self.inodes.get(key)
+            if inode is None:
+                inode = self.inodes[key] = [0, 0, {}]
+            # Use allocated size, sparse files free less than their length
+            inode[0] = st.st_blocks * 512
+            inode[1] = st.st_nlink
+            inode[2][tid] = inode[2].get(tid, 0) + 1
+        self.torrents[tid] = keys
+
+    def unindex(self, tid):
+        keys = self.torrents.pop(tid, None)
+        if keys is None:
+            return
+        for key in keys:
+            refs = self.inodes[key][2]
+            del refs[tid]
+            if not refs:
+                del self.inodes[key]
+
+    def sharing(self, tid):
+        """Other torrents linking to files of tid"""
+        ret = set()
+        for key in self.torrents.get(tid, ()):
+            ret.update(self.inodes[key][2])
+        ret.discard(tid)
+        return ret
+
+    def refresh(self, tids):
+        """lstat() the files of tids again, once links to them are deleted"""
+        for i in tids:
+            if i in self.torrents:
+                self.index(i)
+
+    def build(self, torrents):
+        """
+        Index the torrents of the session (torrent_id -> Torrent)
+        cooperatively on the reactor, return a Deferred
+        """
+        def work():
+            for i in list(torrents):
+                # Skip those removed meanwhile
+                if i in torrents and i not in self.torrents:
+                    self.index(i)
+                yield None
+            log.debug("Indexed files of %d torrents" % len(self.torrents))
+        return task.coiterate(work())
+
+    def plan(self):
+        return ReclaimPlan(self)
+
+    def reclaimable(self, tids):
+        """Bytes actually freed by removing tids together"""
+        plan = self.plan()
+        for i in tids:
+            plan.add(i)
+        return plan.freed
+
+class ReclaimPlan(object):
+    """A growing set of torrents to remove, and the bytes it frees"""
+
+    def __init__(self, index):
+        self.index = index
+        self.links = {} # (dev, ino) -> links held by the planned torrents
+        self.tids = set()
+        self.freed = 0
+
+    def add(self, tid):
+        """Add a torrent to the plan, return the extra bytes freed"""
+        if tid in self.tids:
+            return 0
+        if tid not in self.index:
+            self.index.index(tid)
+        self.tids.add(tid)
+        extra = 0
+        for key, links in self.index.torrents[tid].items():
+            size, nlink, refs = self.index.inodes[key]
+            held = self.links.get(key, 0)
+            self.links[key] = held + links
+            # The inode is freed once the last link goes with the plan
+            if held < nlink <= held + links:
+                extra += size
+        self.freed += extra
+        return extra
@@ -0,0 +1,309 @@
+#
+# removal.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import json
+import stat
+import time
+import threading
+
+from deluge.log import LOG as log
+from twisted.internet import defer, reactor, threads
+
+from common import atomic_write
+
+class RateLimit(object):
+    """A bytes/s budget shared by the deleting threads"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next = 0 # when the budget taken so far is spent
+
+    def take(self, n):
+        """Sleep until n more bytes fit in the budget"""
+        with self.lock:
+            now = time.time()
+            self.next = max(self.next, now) + n / float(self.rate)
+            delay = self.next - now
+        time.sleep(delay)
+
+def shrink_file(path, chunk, limit, progress):
+    """
+    Truncate a file chunk by chunk from its end, within the RateLimit limit,
+    so the filesystem frees its extents gradually instead of in one stall
+    progress(bytes) is called after each chunk
+    """
+    st = os.lstat(path)
+    # Only unlink symlinks and special files, never touch what they point to
+    # Truncating a hard linked file would destroy the other links
+    if not stat.S_ISREG(st.st_mode) or st.st_nlink > 1:
+        return
+    size = st.st_size
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_NOFOLLOW", 0))
+    try:
+        while size > chunk:
+            size -= chunk
+            os.ftruncate(fd, size)
+            os.fsync(fd)
+            progress(chunk)
+            limit.take(chunk)
+    finally:
+        os.close(fd)
+
+def delete_files(save_path, paths, cursor=0, gentle=None, progress=None):
+    """
+    Delete files of a torrent and the directories left empty (run in a thread)
+    Files before cursor are already deleted. If gentle is (chunk, RateLimit),
+    files larger than chunk are shrunk by shrink_file() first.
+    progress(cursor, bytes) is called as data gets freed.
+    """
+    for i in range(cursor, len(paths)):
+        path = paths[i]
+        try:
+            if gentle is not None:
+                shrink_file(path, gentle[0], gentle[1], lambda n: progress(i, n))
+            os.remove(path)
+        except (IOError, OSError) as e:
+            if os.path.exists(path):
+                log.warning("Can't delete %s: %s" % (path, e))
+        if progress is not None:
+            progress(i + 1, 0)
+
+    # Collect the directories between the files and save_path
+    dirs = set()
+    for path in paths:
+        d = os.path.dirname(path)
+        while d != save_path and d.startswith(save_path + os.sep):
+            dirs.add(d)
+            d = os.path.dirname(d)
+    # Deepest first
+    for d in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(d)
+        except OSError:
+            pass
+
+class RemovalPipeline(object):
+    """
+    Remove torrents from the session now, and delete their data later
+
+    remove() queues the files of a torrent for deletion on a bounded number
+    of threads. Pending deletions are saved in a state file so they are
+    resumed after a restart, and their bytes are reported by in_flight()
+    until the files are gone. Saves are batched on a short timer, and the
+    torrents are detached from the session right after the save recording
+    them, before their files are touched.
+
+    With gentle set to (chunk, bytes/s), large files are shrunk gradually
+    before being unlinked, within one bytes/s budget for all the threads.
+    The file cursor and the bytes reclaimed so far are saved as it goes,
+    so an interrupted deletion resumes where it was.
+    """
+
+    def __init__(self, state_file, detach, concurrency=2, gentle=None, save_delay=1.0):
+        # Callable removing a torrent from the session without its data
+        self.detach = detach
+        self.state_file = state_file
+        # Deletions running at once, can change while running
+        self.concurrency = max(1, concurrency)
+        self.active = 0
+        self.waiting = [] # Deferreds of the jobs waiting for a thread
+        self.gentle = gentle
+        self.rate_limit = None # RateLimit of gentle
+        # Seconds to batch state saves
+        self.save_delay = save_delay
+        self.jobs = {} # torrent_id -> job dict
+        self.running = {} # torrent_id -> Deferred
+        self.detaching = [] # (job, Deferred) to detach and start after the next save
+        self.save_timer = None
+
+    def save(self):
+        """Schedule a save of the state"""
+        if self.save_timer is None or not self.save_timer.active():
+            self.save_timer = reactor.callLater(self.save_delay, self.flush)
+
+    def flush(self):
+        """Save the state now, then detach and start the new jobs"""
+        if self.save_timer is not None and self.save_timer.active():
+            self.save_timer.cancel()
+        self.save_timer = None
+        atomic_write(self.state_file, json.dumps(list(self.jobs.values())))
+        detaching, self.detaching = self.detaching, []
+        for job, d in detaching:
+            tid = job["torrent_id"]
+            try:
+                self.detach(tid)
+            except Exception as e:
+                log.error("Failed to remove torrent %s: %s" % (tid, e))
+                del self.jobs[tid]
+                self.running.pop(tid, None)
+                d.errback(e)
+                continue
+            self.start(job).chainDeferred(d)
+
+    def resume(self, session):
+        """
+        Restart the deletions left by the last run, once session (torrent_ids
+        in the session) is loaded
+        """
+        if not os.path.exists(self.state_file):
+            return
+        jobs = [job for job in json.load(open(self.state_file)) if job["torrent_id"] not in self.jobs]
+        if jobs:
+            log.info("Resuming deletion of %d torrents" % len(jobs))
+        for job in jobs:
+            tid = job["torrent_id"]
+            self.jobs[tid] = job
+            if tid in session:
+                # Saved but never detached, finish removing it first
+                self.detach(tid)
+            self.start(job)
+
+    def close(self):
+        """Save what is pending"""
+        if self.save_timer is not None and self.save_timer.active():
+            self.flush()
+
+    def remove(self, tid, save_path, paths, size, device):
+        """
+        Remove a torrent, size is the bytes its deletion will free on device
+        Return a Deferred fired with torrent_id once the data is deleted
+        """
+        job = {
+            "torrent_id": tid,
+            "save_path": save_path,
+            "paths": paths,
+            "size": size,
+            "device": device,
+            "cursor": 0, # files before it are deleted
+            "reclaimed": 0, # bytes freed by shrinking
+        }
+        # Save first, so the files are not left behind if we crash right now
+        self.jobs[tid] = job
+        d = defer.Deferred()
+        self.detaching.append((job, d))
+        self.running[tid] = d
+        self.save()
+        return d
+
+    def start(self, job):
+        def done(result):
+            del self.jobs[job["torrent_id"]]
+            self.save()
+            log.debug("Deleted data of torrent %s" % job["torrent_id"])
+            return job["torrent_id"]
+        def failed(failure):
+            # Don't count it as in flight forever, the files are left behind
+            log.error("Failed to delete data of torrent %s: %s" % (
+                job["torrent_id"], failure.getErrorMessage()))
+            del self.jobs[job["torrent_id"]]
+            self.save()
+            return failure
+        def progress(cursor, freed):
+            reactor.callFromThread(self.progress, job, cursor, freed)
+        d = self.acquire()
+        d.addCallback(lambda result: threads.deferToThread(
+            delete_files, job["save_path"], job["paths"],
+            job.get("cursor", 0), self.gentle_limit(), progress
+        ))
+        def release(result):
+            self.release()
+            return result
+        d.addBoth(release)
+        d.addCallbacks(done, failed)
+        self.running[job["torrent_id"]] = d
+        def forget(result):
+            self.running.pop(job["torrent_id"], None)
+            return result
+        return d.addBoth(forget)
+
+    def acquire(self):
+        """Return a Deferred fired once a deleting thread is free"""
+        d = defer.Deferred()
+        self.waiting.append(d)
+        self.start_waiting()
+        return d
+
+    def release(self):
+        self.active -= 1
+        self.start_waiting()
+
+    def start_waiting(self):
+        while self.waiting and self.active < self.concurrency:
+            self.active += 1
+            self.waiting.pop(0).callback(None)
+
+    def set_concurrency(self, concurrency):
+        """Running deletions finish, only the waiting ones see the new limit"""
+        self.concurrency = max(1, concurrency)
+        self.start_waiting()
+
+    def gentle_limit(self):
+        """gentle as (chunk, RateLimit), the same RateLimit for every job"""
+        if self.gentle is None:
+            return None
+        chunk, rate = self.gentle
+        if self.rate_limit is None or self.rate_limit.rate != rate:
+            self.rate_limit = RateLimit(rate)
+        return chunk, self.rate_limit
+
+    def wait(self):
+        """Return a Deferred fired when the running deletions are done"""
+        return defer.DeferredList(list(self.running.values()), consumeErrors=True)
+
+    def progress(self, job, cursor, freed):
+        """Called on the reactor while a job is deleting files"""
+        if job["torrent_id"] not in self.jobs:
+            return
+        job["cursor"] = cursor
+        if freed:
+            job["reclaimed"] = min(job["size"], job.get("reclaimed", 0) + freed)
+            self.save()
+
+    def in_flight(self, device=None):
+        """Bytes still to be freed by deletion (on device)"""
+        return sum(job["size"] - job.get("reclaimed", 0) for job in self.jobs.values()
+                   if device is None or job["device"] == device)
+
+    def status(self):
+        return {
+            "pending": len(self.jobs),
+            "bytes": self.in_flight(),
+        }
@@ -0,0 +1,450 @@
+#
+# removequeue.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import random
+import binascii
+from array import array
+
+def _hex(b):
+    h = binascii.hexlify(b)
+    return h if isinstance(h, str) else h.decode("ascii")
+
+class IdTable(object):
+    """
+    Intern torrent_ids as 20 byte binary ids behind small integer handles
+    Handles of released ids are reused.
+    """
+    __slots__ = ("ids", "index", "free")
+
+    def __init__(self):
+        self.ids = [] # handle -> binary id, None if free
+        self.index = {} # binary id -> handle
+        self.free = []
+
+    def __len__(self):
+        return len(self.index)
+
+    def lookup(self, tid):
+        """Return the handle of tid, None if it is not interned"""
+        try:
+            return self.index.get(binascii.unhexlify(tid))
+        except (TypeError, ValueError):
+            return None
+
+    def intern(self, tid):
+        return self.intern_id(binascii.unhexlify(tid))
+
+    def intern_id(self, b):
+        """intern() of a binary id"""
+        h = self.index.get(b)
+        if h is not None:
+            return h
+        if self.free:
+            h = self.free.pop()
+            self.ids[h] = b
+        else:
+            h = len(self.ids)
+            self.ids.append(b)
+        self.index[b] = h
+        return h
+
+    def release(self, h):
+        del self.index[self.ids[h]]
+        self.ids[h] = None
+        self.free.append(h)
+
+    def tid(self, h):
+        return _hex(self.ids[h])
+
+class _Group(object):
+    """A priority group, also a node of the implicit treap"""
+    __slots__ = ("members", "weight", "size", "total", "left", "right", "parent")
+
+    def __init__(self, handles=()):
+        self.members = array("i", handles)
+        self.weight = random.random()
+        self.size = 1 # groups in the subtree
+        self.total = len(self.members) # torrents in the subtree
+        self.left = self.right = self.parent = None
+
+def _size(node):
+    return node.size if node else 0
+
+def _total(node):
+    return node.total if node else 0
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    node.total = len(node.members) + _total(node.left) + _total(node.right)
+    if node.left:
+        node.left.parent = node
+    if node.right:
+        node.right.parent = node
+
+def _split(node, k):
+    """Split a treap into the first k groups and the rest"""
+    if not node:
+        return None, None
+    if _size(node.left) >= k:
+        l, node.left = _split(node.left, k)
+        _update(node)
+        if l:
+            l.parent = None
+        node.parent = None
+        return l, node
+    else:
+        node.right, r = _split(node.right, k - _size(node.left) - 1)
+        _update(node)
+        if r:
+            r.parent = None
+        node.parent = None
+        return node, r
+
+def _merge(l, r):
+    """Concatenate two treaps"""
+    if not l or not r:
+        ret = l or r
+        if ret:
+            ret.parent = None
+        return ret
+    if l.weight > r.weight:
+        l.right = _merge(l.right, r)
+        _update(l)
+        l.parent = None
+        return l
+    else:
+        r.left = _merge(l, r.left)
+        _update(r)
+        r.parent = None
+        return r
+
+def _build(nodes):
+    """Treap of nodes in this order, in O(n)"""
+    stack = [] # right spine
+    for node in nodes:
+        last = None
+        while stack and stack[-1].weight < node.weight:
+            last = stack.pop()
+            _update(last)
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    for node in reversed(stack):
+        _update(node)
+    if not stack:
+        return None
+    stack[0].parent = None
+    return stack[0]
+
+class RemoveQueue(object):
+    """
+    Remove queue, an ordered list of priority groups
+    Priority groups are kept in an implicit treap, and each torrent maps to
+    the group it belongs to, so priority lookups and moving a group are
+    O(log n) in the number of groups
+    Torrent_ids are interned in an IdTable, groups only hold their handles
+    Priority 0 is the top of the queue (removed first)
+    """
+
+    def __init__(self, groups=()):
+        self.root = None
+        self.table = IdTable()
+        self.group_of = [] # handle -> _Group
+        # Called with (method_name, args) after every mutation, the handle
+        # of a discarded torrent is released after them
+        self.listeners = []
+        # Lowest priority whose groups shifted in the last mutation, None
+        # if none did, for the listeners
+        self.shifted = None
+        for p in groups:
+            self.insert(p)
+
+    def __len__(self):
+        return _size(self.root)
+
+    def __contains__(self, tid):
+        return self.table.lookup(tid) is not None
+
+    def _nodes(self):
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    def __iter__(self):
+        """Iterate over groups (lists of torrent_id) from top to bottom"""
+        tid = self.table.tid
+        for node in self._nodes():
+            yield [tid(h) for h in node.members]
+
+    def handle_groups(self):
+        """Iterate over groups (arrays of handles) from top to bottom"""
+        for node in self._nodes():
+            yield node.members
+
+    def torrents(self):
+        return [_hex(b) for b in self.table.index]
+
+    def torrent_count(self):
+        return len(self.table)
+
+    # Compact form, for snapshots
+    def pack(self):
+        """Return (concatenated binary ids, group sizes) from top to bottom"""
+        ids = self.table.ids
+        data = []
+        sizes = []
+        for node in self._nodes():
+            data.extend(ids[h] for h in node.members)
+            sizes.append(len(node.members))
+        return b"".join(data), sizes
+
+    @classmethod
+    def unpack(cls, data, sizes):
+        rq = cls()
+        table, group_of = rq.table, rq.group_of
+        nodes = []
+        offset = 0
+        for n in sizes:
+            node = _Group()
+            for i in range(offset, offset + n * 20, 20):
+                b = data[i:i + 20]
+                if b in table.index:
+                    continue
+                h = table.intern_id(b)
+                group_of.append(node)
+                node.members.append(h)
+            offset += n * 20
+            if node.members:
+                nodes.append(node)
+        # Straight into a treap, without a split per group
+        rq.root = _build(nodes)
+        return rq
+
+    # Internal helpers
+    def _record(self, op, *args):
+        for listener in self.listeners:
+            listener(op, list(args))
+
+    def _rank(self, node):
+        r = _size(node.left)
+        while node.parent:
+            if node is node.parent.right:
+                r += _size(node.parent.left) + 1
+            node = node.parent
+        return r
+
+    def _node_at(self, pos):
+        node = self.root
+        while node:
+            l = _size(node.left)
+            if pos < l:
+                node = node.left
+            elif pos == l:
+                return node
+            else:
+                pos -= l + 1
+                node = node.right
+        raise IndexError("Priority %d out of range" % pos)
+
+    def _insert_node(self, node, pos):
+        l, r = _split(self.root, pos)
+        self.root = _merge(_merge(l, node), r)
+
+    def _detach(self, node):
+        """Take node out of the treap, return the priority it had"""
+        rank = self._rank(node)
+        l, r = _split(self.root, rank)
+        m, r = _split(r, 1)
+        self.root = _merge(l, r)
+        return rank
+
+    def _members_changed(self, node):
+        """Update torrent counts after members of node changed"""
+        while node is not None:
+            node.total = len(node.members) + _total(node.left) + _total(node.right)
+            node = node.parent
+
+    def _next(self, node):
+        """In-order successor"""
+        if node.right:
+            node = node.right
+            while node.left:
+                node = node.left
+            return node
+        while node.parent and node is node.parent.right:
+            node = node.parent
+        return node.parent
+
+    def _clamp(self, pos, length):
+        return max(0, min(pos, length))
+
+    def _intern(self, tid, node):
+        h = self.table.intern(tid)
+        if h == len(self.group_of):
+            self.group_of.append(node)
+        else:
+            self.group_of[h] = node
+        return h
+
+    def _release(self, h):
+        self.group_of[h] = None
+        self.table.release(h)
+
+    # Queries
+    def priority(self, tid):
+        """Return the priority of tid, or None if it is not in the queue"""
+        h = self.table.lookup(tid)
+        if h is None:
+            return None
+        return self._rank(self.group_of[h])
+
+    def group(self, pos):
+        """Return torrent_ids in the priority pos"""
+        return [self.table.tid(h) for h in self._node_at(pos).members]
+
+    def groups_from(self, pos):
+        """Iterate over (priority, [torrent_id, ...]) from priority pos down"""
+        if pos >= len(self):
+            return
+        node = self._node_at(pos)
+        tid = self.table.tid
+        while node is not None:
+            yield pos, [tid(h) for h in node.members]
+            node, pos = self._next(node), pos + 1
+
+    def page(self, offset, limit):
+        """
+        Return up to limit (torrent_id, priority) from the offset-th torrent,
+        in queue order
+        """
+        node, rank = self.root, 0
+        while node:
+            l = _total(node.left)
+            if offset < l:
+                node = node.left
+            elif offset < l + len(node.members):
+                offset -= l
+                rank += _size(node.left)
+                break
+            else:
+                offset -= l + len(node.members)
+                rank += _size(node.left) + 1
+                node = node.right
+        ret = []
+        tid = self.table.tid
+        while node is not None and len(ret) < limit:
+            for h in node.members[offset:offset + limit - len(ret)]:
+                ret.append((tid(h), rank))
+            node, rank, offset = self._next(node), rank + 1, 0
+        return ret
+
+    # Mutations
+    def insert(self, tids, pos=None):
+        """
+        Insert a new priority group containing tids at pos (default bottom)
+        Torrents already in the queue are skipped, return the inserted ones
+        """
+        added = []
+        node = _Group()
+        for i in tids:
+            if i in self:
+                continue
+            node.members.append(self._intern(i, node))
+            added.append(i)
+        if not added:
+            return []
+        node.total = len(node.members)
+        if pos is None:
+            pos = len(self)
+        self.shifted = self._clamp(pos, len(self))
+        self._insert_node(node, self.shifted)
+        self._record("insert", added, pos)
+        return added
+
+    def extend(self, pos, tids):
+        """
+        Put tids into the existing priority pos,
+        or a new group if pos is out of range
+        """
+        if pos < 0 or pos >= len(self):
+            return self.insert(tids, 0 if pos < 0 else None)
+        node = self._node_at(pos)
+        added = []
+        for i in tids:
+            if i in self:
+                continue
+            node.members.append(self._intern(i, node))
+            added.append(i)
+        if added:
+            self._members_changed(node)
+            self.shifted = None
+            self._record("extend", pos, added)
+        return added
+
+    def discard(self, tid):
+        """Remove tid from the queue, prune its group if it becomes empty"""
+        h = self.table.lookup(tid)
+        if h is None:
+            return False
+        node = self.group_of[h]
+        node.members.remove(h)
+        if not node.members:
+            self.shifted = self._detach(node)
+        else:
+            self._members_changed(node)
+            self.shifted = None
+        self._record("discard", tid)
+        self._release(h)
+        return True
+
+    def move(self, tid, pos):
+        """Move the group of tid to priority pos"""
+        node = self.group_of[self.table.lookup(tid)]
+        old = self._detach(node)
+        new = self._clamp(pos, len(self))
+        self._insert_node(node, new)
+        self.shifted = None if old == new else min(old, new)
+        self._record("move", tid, pos)
@@ -0,0 +1,229 @@
+#
+# rules.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import re
+import json
+import time
+import heapq
+import numbers
+
+from deluge.log import LOG as log
+from twisted.internet import reactor
+
+from common import atomic_write, string_types
+
+def _number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+class Rule(object):
+    """
+    A compiled auto-enqueue rule
+
+    Made from a dict where every key but name and position is a condition,
+    all of them must hold:
+        ratio             ratio >= value
+        seeding_time      seconds seeding >= value
+        completed_before  completed at least value seconds ago
+        tracker           regex searched in the tracker host
+        label             label equals value
+        state             state equals value
+    position is "bottom" (default), "top" or a priority number.
+    Raise ValueError if d is not a valid rule.
+    """
+    __slots__ = ("name", "checks", "fields", "completed_before", "position")
+
+    def __init__(self, d):
+        self.name = d.get("name", "")
+        self.position = d.get("position", "bottom")
+        if self.position not in ("bottom", "top") and not (
+                isinstance(self.position, int) and not isinstance(self.position, bool)
+                and self.position >= 0):
+            raise ValueError("Bad position %r in rule %r" % (self.position, self.name))
+        self.completed_before = None
+        self.checks = []
+        self.fields = set()
+        for key, value in d.items():
+            if key in ("name", "position"):
+                continue
+            if key in ("ratio", "seeding_time", "completed_before") and not _number(value):
+                raise ValueError("%s must be a number in rule %r" % (key, self.name))
+            elif key == "tracker" and not isinstance(value, string_types):
+                raise ValueError("tracker must be a regex in rule %r" % self.name)
+
+            if key == "ratio":
+                self.add_check("ratio", lambda v, x=value: v is not None and v >= x)
+            elif key == "seeding_time":
+                self.add_check("seeding_time", lambda v, x=value: v is not None and v >= x)
+            elif key == "completed_before":
+                self.completed_before = value
+                self.add_check("completed_time",
+                    lambda v, x=value: bool(v) and time.time() - v >= x)
+            elif key == "tracker":
+                self.add_check("tracker_host",
+                    lambda v, x=re.compile(value): bool(v) and x.search(v) is not None)
+            elif key == "label":
+                self.add_check("label", lambda v, x=value: v == x)
+            elif key == "state":
+                self.add_check("state", lambda v, x=value: v == x)
+            else:
+                raise ValueError("Unknown condition %r in rule %r" % (key, self.name))
+
+    def add_check(self, field, check):
+        self.checks.append((field, check))
+        self.fields.add(field)
+
+    def matches(self, get):
+        """get(field) returns the field of the torrent"""
+        for field, check in self.checks:
+            if not check(get(field)):
+                return False
+        return True
+
+class AutoEnqueue(object):
+    """
+    Put torrents into the queue when they match a rule
+
+    Torrents are only evaluated when a field some rule depends on changes
+    in the StatusCache, and when a completed_before delay expires (kept in
+    a heap, checked by tick()). enqueue(torrent_id, rule) does the actual
+    queueing. Torrents the user took out of the queue while rules exist are
+    excluded, so their ratio or seeding time going up doesn't put them
+    back. The exclusions are saved to state_file, batched over save_delay.
+    """
+
+    def __init__(self, rules, status, is_queued, enqueue, state_file=None, save_delay=1.0):
+        self.status = status
+        self.is_queued = is_queued
+        self.enqueue = enqueue
+        self.state_file = state_file
+        self.save_delay = save_delay
+        self.save_timer = None
+        self.excluded = set()
+        if state_file is not None and os.path.exists(state_file):
+            try:
+                with open(state_file) as f:
+                    self.excluded = set(json.load(f))
+            except (IOError, OSError, ValueError) as e:
+                log.warning("Can't read the auto-enqueue exclusions: %s" % e)
+        self.due = [] # heap of (time, torrent_id)
+        self.set_rules(rules)
+
+    def save(self):
+        """Schedule a save of the exclusions"""
+        if self.state_file is None:
+            return
+        if self.save_timer is None or not self.save_timer.active():
+            self.save_timer = reactor.callLater(self.save_delay, self.flush)
+
+    def flush(self):
+        if self.save_timer is not None and self.save_timer.active():
+            self.save_timer.cancel()
+        self.save_timer = None
+        atomic_write(self.state_file, json.dumps(sorted(self.excluded)))
+
+    def close(self):
+        """Save what is pending"""
+        if self.save_timer is not None and self.save_timer.active():
+            self.flush()
+
+    def set_rules(self, rules):
+        self.rules = []
+        for d in rules:
+            try:
+                self.rules.append(Rule(d))
+            except (ValueError, re.error) as e:
+                log.error("Ignore auto-enqueue rule: %s" % e)
+        self.fields = set()
+        for rule in self.rules:
+            self.fields |= rule.fields
+        self.due = []
+
+    def on_change(self, tid, changed):
+        """StatusCache listener"""
+        if not self.rules or tid in self.excluded or self.is_queued(tid):
+            return
+        if "completed_time" in changed:
+            completed = self.status.get(tid, "completed_time")
+            for rule in self.rules:
+                if rule.completed_before is not None and completed:
+                    heapq.heappush(self.due, (completed + rule.completed_before, tid))
+        if self.fields.intersection(changed):
+            self.evaluate(tid)
+
+    def exclude(self, tid):
+        """Keep a torrent the user took out of the queue out of it"""
+        if self.rules and tid not in self.excluded:
+            self.excluded.add(tid)
+            self.save()
+
+    def forget(self, tid):
+        """The torrent left the session"""
+        if tid in self.excluded:
+            self.excluded.discard(tid)
+            self.save()
+
+    def prune(self, session):
+        """Forget the torrents not in session any more"""
+        if not self.excluded.issubset(session):
+            self.excluded.intersection_update(session)
+            self.save()
+
+    def evaluate(self, tid):
+        if tid not in self.status or tid in self.excluded or self.is_queued(tid):
+            return False
+        get = lambda field: self.status.get(tid, field)
+        for rule in self.rules:
+            if rule.matches(get):
+                log.debug("Torrent %s matches auto-enqueue rule %r" % (tid, rule.name))
+                self.enqueue(tid, rule)
+                return True
+        return False
+
+    def tick(self):
+        """Evaluate the torrents whose completed_before delay expired"""
+        now = time.time()
+        while self.due and self.due[0][0] <= now:
+            t, tid = heapq.heappop(self.due)
+            self.evaluate(tid)
+
+    def evaluate_all(self, tids):
+        """Evaluate every torrent once, e.g. after the rules changed"""
+        for i in tids:
+            self.on_change(i, self.fields | set(["completed_time"]))
@@ -0,0 +1,132 @@
+#
+# scheduler.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import time
+
+from deluge.log import LOG as log
+from twisted.internet import reactor
+
+class CheckScheduler(object):
+    """
+    Schedule check_and_remove() by predicting when free space will reach
+    the remove threshold
+
+    sample() returns (headroom, download_rate), where headroom is the free
+    space above the remove threshold of the fullest volume, and check()
+    does the actual check. Disk consumption is estimated from both the
+    session download rate and the observed headroom trend, and the next
+    check is scheduled at half of the estimated time to threshold, clamped
+    to [min_interval, max_interval].
+    """
+
+    # Weight of the newest headroom trend in the moving average
+    smoothing = 0.5
+    # Check again after this fraction of the time to threshold
+    safety = 0.5
+
+    def __init__(self, check, sample, min_interval=5, max_interval=300):
+        self.check = check
+        self.sample = sample
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self.timer = None
+        self.last = None # (time, headroom)
+        self.trend = 0.0 # bytes/s consumed, from headroom samples
+        self.status = {}
+
+    def start(self):
+        self.run()
+
+    def stop(self):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+
+    def run(self):
+        try:
+            headroom, download_rate = self.sample()
+            self.update_trend(headroom)
+        except Exception as e:
+            log.exception(e)
+            headroom, download_rate = 0, 0
+        # Check even when the prediction failed
+        try:
+            self.check()
+        except Exception as e:
+            log.exception(e)
+
+        interval = self.next_interval(headroom, download_rate)
+        self.timer = reactor.callLater(interval, self.run)
+
+    def update_trend(self, headroom):
+        now = time.time()
+        if headroom is not None and self.last is not None and now > self.last[0]:
+            # Space freed by removals is not consumption, clip it at 0
+            consumed = max(0.0, (self.last[1] - headroom) / (now - self.last[0]))
+            self.trend += self.smoothing * (consumed - self.trend)
+        self.last = None if headroom is None else (now, headroom)
+
+    def next_interval(self, headroom, download_rate):
+        """Decide when to check next and record why"""
+        rate = max(download_rate, self.trend)
+        if headroom is None:
+            # Nothing queued, nothing to predict
+            eta = None
+            interval = self.max_interval
+        else:
+            if headroom <= 0:
+                eta = 0
+            elif rate > 0:
+                eta = headroom / float(rate)
+            else:
+                eta = None
+            interval = self.max_interval if eta is None else eta * self.safety
+
+        interval = max(self.min_interval, min(self.max_interval, interval))
+        self.status = {
+            "headroom": headroom,
+            "download_rate": download_rate,
+            "trend": self.trend,
+            "time_to_threshold": eta,
+            "interval": interval,
+            "next_check": time.time() + interval,
+        }
+        log.debug("Next disk space check in %.1fs" % interval)
+        return interval
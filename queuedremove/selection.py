@@ -0,0 +1,110 @@
+#
+# selection.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import bisect
+
+def select_groups(candidates, need, node_limit=5000):
+    """
+    Pick candidates covering need bytes at the lowest total cost
+
+    candidates is a list of (key, bytes, cost). This is a covering
+    knapsack, solved by depth first branch and bound over the candidates
+    sorted by cost per byte, bounded by the fractional relaxation. The
+    search stops after node_limit nodes, keeping the best cover so far,
+    so the time is bounded whatever the window size.
+
+    Return the chosen keys, or all of them if they can't cover need.
+    """
+    if need <= 0:
+        return []
+    items = [c for c in candidates if c[1] > 0]
+    if sum(c[1] for c in items) < need:
+        return [c[0] for c in candidates]
+    items.sort(key=lambda c: c[2] / float(c[1]))
+
+    # Start from the greedy cover so pruning works right away
+    best = []
+    covered = 0
+    for c in items:
+        if covered >= need:
+            break
+        best.append(c)
+        covered += c[1]
+    best_cost = sum(c[2] for c in best)
+
+    # Prefix sums of bytes and cost, for the bound
+    sizes = [0]
+    costs = [0]
+    for key, size, c in items:
+        sizes.append(sizes[-1] + size)
+        costs.append(costs[-1] + c)
+
+    def bound(i, remaining):
+        """Lowest cost to cover remaining with items[i:], fractionally"""
+        k = bisect.bisect_left(sizes, sizes[i] + remaining, i + 1)
+        if k >= len(sizes):
+            return None # can't be covered
+        key, size, c = items[k - 1]
+        return costs[k - 1] - costs[i] + c * (sizes[i] + remaining - sizes[k - 1]) / float(size)
+
+    # Depth first with an explicit stack, taking items[i] before leaving
+    # it out. chosen is a linked list (item, rest), nodes share the prefix
+    nodes = 0
+    stack = [(0, None, 0, need)]
+    while stack and nodes < node_limit:
+        i, chosen, cost, remaining = stack.pop()
+        nodes += 1
+        if remaining <= 0:
+            if cost < best_cost:
+                best_cost = cost
+                best = []
+                while chosen is not None:
+                    item, chosen = chosen
+                    best.append(item)
+                best.reverse()
+            continue
+        if i >= len(items):
+            continue
+        b = bound(i, remaining)
+        if b is None or cost + b >= best_cost:
+            continue
+        key, size, c = items[i]
+        stack.append((i + 1, chosen, cost, remaining))
+        stack.append((i + 1, (items[i], chosen), cost + c, remaining - size))
+    return [c[0] for c in best]
@@ -0,0 +1,129 @@
+#
+# snapshot.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import time
+
+class PrioritySnapshot(object):
+    """
+    Versioned priorities of a RemoveQueue, for the status field and deltas
+
+    get() reads the priority from the queue itself. Listening to the queue,
+    it records which torrents entered or left it, and the lowest priority
+    from which groups shifted (a move only shifts the ones between its old
+    and new priority). Every queue change (invalidate()) bumps the version
+    and logs them, so clients can fetch only the changes since the version
+    they have.
+    """
+
+    # Forget the oldest changes once there are this many versions
+    max_log = 1000
+
+    def __init__(self, rq):
+        self.rq = rq
+        # Versions start from the time, so a version from before a restart
+        # is older than the horizon
+        self.version = int(time.time() * 1000)
+        # [(version, lowest shifted priority or None, set(torrent_id))]
+        self.log = []
+        # Changes older than this have been forgotten
+        self.horizon = self.version
+        # Since the last version
+        self.shifted = None
+        self.tids = set()
+
+    def __call__(self, op, args):
+        """RemoveQueue listener"""
+        shifted = self.rq.shifted
+        if shifted is not None and (self.shifted is None or shifted < self.shifted):
+            self.shifted = shifted
+        if op == "insert":
+            self.tids.update(args[0])
+        elif op == "extend":
+            self.tids.update(args[1])
+        elif op == "discard":
+            self.tids.add(args[0])
+
+    def invalidate(self):
+        self.refresh()
+
+    def refresh(self):
+        """Turn the changes since the last version into a new version"""
+        if self.shifted is None and not self.tids:
+            return
+        self.version += 1
+        self.log.append((self.version, self.shifted, self.tids))
+        self.shifted, self.tids = None, set()
+        if len(self.log) > self.max_log:
+            del self.log[:len(self.log) - self.max_log]
+            self.horizon = self.log[0][0] - 1
+
+    def get(self, tid):
+        rp = self.rq.priority(tid)
+        return "" if rp is None else rp
+
+    def since(self, version=None):
+        """
+        Return {"version", "full", "priorities"}
+        Removed torrents have priority None in a delta.
+        """
+        self.refresh()
+        if version is not None and self.horizon <= version <= self.version:
+            if version == self.version:
+                # Not modified
+                return {"version": version, "full": False, "priorities": {}}
+            shifted, tids = None, set()
+            for v, s, t in reversed(self.log):
+                if v <= version:
+                    break
+                if s is not None and (shifted is None or s < shifted):
+                    shifted = s
+                tids.update(t)
+            # Everything shifted, e.g. removals from the top
+            if shifted != 0:
+                priorities = dict((i, self.rq.priority(i)) for i in tids)
+                if shifted is not None:
+                    for rp, group in self.rq.groups_from(shifted):
+                        for i in group:
+                            priorities[i] = rp
+                return {"version": self.version, "full": False, "priorities": priorities}
+        return {
+            "version": self.version,
+            "full": True,
+            "priorities": dict((i, rp) for rp, group in enumerate(self.rq) for i in group),
+        }
@@ -0,0 +1,168 @@
+#
+# statuscache.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+from deluge.log import LOG as log
+from twisted.internet import defer, task
+
+class StatusCache(object):
+    """
+    Columnar cache of the torrent status fields the plugin needs
+
+    One list per field, and torrent_id -> row. Rows are refreshed in
+    batches cooperatively on the reactor by refresh_all(), one status call
+    per batch, or one by one with refresh() when an event says a torrent
+    changed. Missing rows are read on demand. It covers every torrent of
+    the session, not only the queued ones, so it is keyed by torrent_id
+    like the session itself.
+    """
+
+    fields = (
+        "name",
+        "total_wanted_done",
+        "total_wanted",
+        "save_path",
+        "upload_payload_rate",
+        "download_payload_rate",
+        "ratio",
+        "total_seeds",
+        "seeding_time",
+        "completed_time",
+        "state",
+        "tracker_host",
+        "label", # from the Label plugin, None without it
+    )
+
+    # Torrents read per status call by refresh_all()
+    batch = 500
+
+    def __init__(self, torrents, read, read_many):
+        self.torrents = torrents
+        # Callable returning a status dict from (torrent_id, fields)
+        self.read = read
+        # Callable returning {torrent_id: status dict}, or a Deferred
+        # of it, from ([torrent_id, ...], fields)
+        self.read_many = read_many
+        self.rows = {} # torrent_id -> row
+        self.free = []
+        self.columns = dict((f, []) for f in self.fields)
+        self.refreshing = None
+        # Called with (torrent_id, changed fields) after a row changed
+        self.listeners = []
+        # Bumped on every row change, torrent_id -> version it last changed
+        self.version = 0
+        self.changed_at = {}
+
+    def __contains__(self, tid):
+        return tid in self.rows
+
+    def get(self, tid, field):
+        row = self.rows.get(tid)
+        if row is None:
+            row = self.refresh(tid)
+        return self.columns[field][row]
+
+    def column(self, field, tids):
+        """Values of field for tids"""
+        col = self.columns[field]
+        return [col[self.rows[i]] if i in self.rows else self.get(i, field) for i in tids]
+
+    def refresh(self, tid):
+        """Read the fields of a torrent from the session, return its row"""
+        return self.store(tid, self.read(tid, self.fields))
+
+    def store(self, tid, status):
+        """Put the status dict of a torrent in its row, return the row"""
+        row = self.rows.get(tid)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                row = len(self.columns[self.fields[0]])
+                for col in self.columns.values():
+                    col.append(None)
+            self.rows[tid] = row
+            changed = self.fields
+        else:
+            changed = [f for f in self.fields if self.columns[f][row] != status.get(f)]
+        for f in self.fields:
+            self.columns[f][row] = status.get(f)
+        if changed:
+            self.version += 1
+            self.changed_at[tid] = self.version
+            for listener in self.listeners:
+                # A failing listener must not fail the reads
+                try:
+                    listener(tid, changed)
+                except Exception as e:
+                    log.exception(e)
+        return row
+
+    def forget(self, tid):
+        row = self.rows.pop(tid, None)
+        if row is None:
+            return
+        self.changed_at.pop(tid, None)
+        for col in self.columns.values():
+            col[row] = None
+        self.free.append(row)
+
+    def refresh_all(self, tids=None):
+        """Refresh tids (default every torrent) in batches, return a Deferred"""
+        if self.refreshing is not None:
+            return self.refreshing
+        def store(statuses):
+            for i, status in statuses.items():
+                # Skip those removed meanwhile
+                if i in self.torrents:
+                    self.store(i, status)
+        def work():
+            ids = list(self.torrents.keys() if tids is None else tids)
+            for n in range(0, len(ids), self.batch):
+                batch = [i for i in ids[n:n + self.batch] if i in self.torrents]
+                if batch:
+                    yield defer.maybeDeferred(self.read_many, batch, self.fields).addCallback(store)
+            for i in [i for i in self.rows if i not in self.torrents]:
+                self.forget(i)
+        def done(result):
+            self.refreshing = None
+            return result
+        def failed(failure):
+            log.error("Failed to refresh the status cache: %s" % failure.getErrorMessage())
+        self.refreshing = task.coiterate(work())
+        return self.refreshing.addErrback(failed).addBoth(done)
@@ -0,0 +1,158 @@
+#
+# volumes.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import time
+
+from deluge.log import LOG as log
+
+class VolumeIndex(object):
+    """
+    Group queued torrents by the filesystem they are saved on
+
+    Keeps device -> set of queued torrents, and caches statvfs() of
+    every device for a short time. It listens to RemoveQueue to index
+    torrents as they enter and leave the queue. Torrents are kept as
+    their handles in the IdTable of the queue.
+    """
+
+    # Seconds to cache statvfs() results
+    ttl = 2
+
+    def __init__(self, save_path, table, overrides=None, fs=os):
+        # Callable returning the save_path of a torrent
+        self.save_path = save_path
+        # IdTable of the queue, only queued torrents are indexed
+        self.table = table
+        # Provides stat() and statvfs()
+        self.fs = fs
+        self.members = {} # device -> set(handle)
+        self.device = [] # handle -> device, None if not indexed
+        self.paths = {} # device -> a path on it, for statvfs()
+        self.statvfs_cache = {} # device -> (time, free_space)
+        self.set_overrides(overrides or {})
+
+    def set_overrides(self, overrides):
+        """
+        overrides is {path: {"remove_threshold": ..., "stop_threshold": ...}},
+        path can be any path on the volume, usually the mount point
+        """
+        self.overrides = {}
+        for path, prefs in overrides.items():
+            try:
+                self.overrides[self.fs.stat(path).st_dev] = prefs
+            except OSError as e:
+                log.warning("Ignore thresholds of %s: %s" % (path, e))
+
+    def threshold(self, device, key, default):
+        return self.overrides.get(device, {}).get(key, default)
+
+    # Indexing
+    def index(self, tid):
+        self.unindex(tid)
+        h = self.table.lookup(tid)
+        if h is None:
+            return
+        path = self.save_path(tid)
+        try:
+            dev = self.fs.stat(path).st_dev
+        except OSError as e:
+            log.warning("Can't stat save path of torrent %s: %s" % (tid, e))
+            return
+        if h >= len(self.device):
+            self.device.extend([None] * (h + 1 - len(self.device)))
+        members = self.members.get(dev)
+        if members is None:
+            members = self.members[dev] = set()
+        else:
+            # Share one device object between the torrents
+            dev = self.device[next(iter(members))]
+        self.device[h] = dev
+        members.add(h)
+        self.paths[dev] = path
+
+    def unindex(self, tid):
+        h = self.table.lookup(tid)
+        dev = self.handle_device(h)
+        if dev is None:
+            return
+        self.device[h] = None
+        members = self.members[dev]
+        members.discard(h)
+        if not members:
+            # Keep paths[dev], the volume may be checked again later
+            del self.members[dev]
+
+    def handle_device(self, h):
+        """Device of the torrent with handle h, None if not indexed"""
+        if h is None or h >= len(self.device):
+            return None
+        return self.device[h]
+
+    def device_of(self, tid):
+        return self.handle_device(self.table.lookup(tid))
+
+    def __call__(self, op, args):
+        """RemoveQueue listener"""
+        if op == "insert":
+            for i in args[0]:
+                self.index(i)
+        elif op == "extend":
+            for i in args[1]:
+                self.index(i)
+        elif op == "discard":
+            self.unindex(args[0])
+
+    # Free space
+    def free_space(self, dev):
+        now = time.time()
+        cached = self.statvfs_cache.get(dev)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+        st = self.fs.statvfs(self.paths[dev])
+        free = st.f_bavail * st.f_frsize
+        self.statvfs_cache[dev] = (now, free)
+        return free
+
+    def expire(self, dev):
+        """Forget the cached free space, e.g. after removing from the volume"""
+        self.statvfs_cache.pop(dev, None)
+
+    def volumes(self):
+        return list(self.members)
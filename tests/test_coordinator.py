@@ -0,0 +1,148 @@
+#
+# test_coordinator.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+import json
+import shutil
+import tempfile
+import unittest
+
+try:
+    from coordinator import Coordinator, plan_removals
+except ImportError as e:
+    # Needs deluge
+    raise unittest.SkipTest(str(e))
+
+from coordinator import fcntl
+
+GB = 1 << 30
+
+class CoordinatorTest(unittest.TestCase):
+    """Two daemons sharing a volume, in one process"""
+
+    def setUp(self):
+        if fcntl is None:
+            raise unittest.SkipTest("Coordination needs fcntl.flock()")
+        self.dir = tempfile.mkdtemp()
+        self.a = Coordinator(self.dir, "a", gone_after=60)
+        self.b = Coordinator(self.dir, "b", gone_after=60)
+        self.a.start()
+        self.b.start()
+
+    def tearDown(self):
+        self.a.stop()
+        self.b.stop()
+        shutil.rmtree(self.dir)
+
+    def publish(self, coordinator, *sizes):
+        groups = [[size * GB, ["%s%d" % (coordinator.id, n)]] for n, size in enumerate(sizes)]
+        coordinator.publish(0, 0, groups)
+
+    def plan(self, free_space=1 * GB):
+        return self.a.plan(free_space, 5 * GB, 10 * GB)
+
+    def test_leader(self):
+        self.assertTrue(self.a.is_leader())
+        self.assertTrue(self.a.is_leader())
+        self.assertFalse(self.b.is_leader())
+        self.a.resign()
+        self.assertTrue(self.b.is_leader())
+        self.assertFalse(self.a.is_leader())
+
+    def test_plan_once(self):
+        self.publish(self.a, 4, 4, 4)
+        self.publish(self.b, 3, 3, 3)
+        self.assertTrue(self.a.is_leader())
+        self.assertEqual(self.a.plan(20 * GB, 5 * GB, 10 * GB), None)
+        plan = self.plan()
+        self.assertEqual(plan["need"], 10 * GB)
+        self.assertEqual(plan["assignments"], {"a": ["a0", "a1"], "b": ["b0"]})
+        self.assertEqual(self.a.assigned(), ["a0", "a1"])
+        self.assertEqual(self.b.assigned(), ["b0"])
+        self.assertEqual(self.a.assigned(), [])
+        self.assertEqual(self.b.assigned(), [])
+        # Not carried out again after a restart
+        self.b.publish(0, 0, [])
+        b = Coordinator(self.dir, "b")
+        b.start()
+        self.assertEqual(b.assigned(), [])
+
+    def test_wait_for_assigned(self):
+        self.publish(self.a, 4)
+        self.publish(self.b, 3)
+        self.assertTrue(self.a.is_leader())
+        self.assertEqual(self.plan()["epoch"], 1)
+        self.a.assigned()
+        self.publish(self.a, 1)
+        # b hasn't carried out its part yet, its data may be in flight
+        self.assertEqual(self.plan(), None)
+        self.b.assigned()
+        self.publish(self.b, 2)
+        self.assertEqual(self.plan()["epoch"], 2)
+
+    def test_gone(self):
+        self.publish(self.a, 4)
+        self.publish(self.b, 3)
+        self.assertTrue(self.a.is_leader())
+        self.plan()
+        self.a.assigned()
+        self.publish(self.a, 1, 1)
+        # b died before carrying out the plan
+        offer = json.load(open(self.b.offer_file))
+        offer["time"] -= 120
+        with open(self.b.offer_file, "w") as f:
+            json.dump(offer, f)
+        self.assertEqual(list(self.a.offers()), ["a"])
+        plan = self.plan()
+        self.assertEqual(plan["epoch"], 2)
+        self.assertEqual(plan["assignments"], {"a": ["a0", "a1"]})
+
+class PlanRemovalsTest(unittest.TestCase):
+
+    def test_turns(self):
+        offers = {
+            "a": {"in_flight": 0, "demand": 0, "groups": [[1, ["a0"]], [1, ["a1"]]]},
+            "b": {"in_flight": 1, "demand": 0, "groups": [[1, ["b0", "b1"]]]},
+        }
+        self.assertEqual(plan_removals(offers, 10, 5, 8), (0, {}))
+        # projected 4, need max(8 - 1, 5 - 4)
+        need, assignments = plan_removals(offers, 3, 5, 8)
+        self.assertEqual(need, 7)
+        self.assertEqual(assignments, {"a": ["a0", "a1"], "b": ["b0", "b1"]})
+        need, assignments = plan_removals(offers, 3, 5, 2)
+        self.assertEqual(need, 1)
+        self.assertEqual(assignments, {"a": ["a0"]})
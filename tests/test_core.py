@@ -0,0 +1,106 @@
+#
+# test_core.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+try:
+    import deluge.configmanager
+    from core import Core
+    from standins import Session
+except ImportError as e:
+    # Needs deluge and twisted
+    raise unittest.SkipTest(str(e))
+
+class CoreTest(unittest.TestCase):
+    """Core driven with the benchmark stand-ins for the session"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        deluge.configmanager.set_config_dir(self.config_dir)
+        self.session = Session(1, seed=1)
+        self.session.install()
+        self.tids = self.session.add_torrents(10, from_state=True)
+        self.core = Core.__new__(Core)
+        self.core.fs = self.session.fs
+        self.core.enable()
+        self.core.scheduler.stop()
+
+    def tearDown(self):
+        self.core.disable()
+        self.session.uninstall()
+        shutil.rmtree(self.config_dir)
+
+    def queue(self):
+        return [list(g) for g in self.core.rq]
+
+    def test_batch_atomic(self):
+        t = self.tids
+        self.core.batch([{"op": "add", "tids": t[:3]}, {"op": "set", "tids": [t[2]], "pos": 0}])
+        before = self.queue()
+        version = self.core.snapshot.since()["version"]
+        for bad in (
+            {"op": "add", "tids": [t[4]], "ascend": "no"},
+            {"op": "set", "tids": [t[0]], "pos": True},
+            {"op": "set", "tids": [t[0]]},
+            {"op": "remove", "tids": [["x"]]},
+            {"op": "remove", "tids": t[0]},
+            {"op": "shuffle", "tids": [t[0]]},
+            ["remove", [t[0]]],
+        ):
+            ops = [{"op": "remove", "tids": [t[0]]}, {"op": "add", "tids": [t[3]]}, bad]
+            self.assertRaises(ValueError, self.core.batch, ops)
+            self.assertEqual(self.queue(), before)
+        self.assertRaises(ValueError, self.core.batch, {"op": "add", "tids": [t[3]]})
+        self.assertEqual(self.queue(), before)
+        self.assertEqual(self.core.snapshot.since(version)["priorities"], {})
+
+    def test_queue_event_on_change(self):
+        self.core.batch([{"op": "add", "tids": self.tids[:3]}])
+        self.assertTrue(self.core.queue_event.active())
+        self.core.queue_event.cancel()
+        # A check that removed nothing
+        self.core.apply_queue_change()
+        self.assertFalse(self.core.queue_event.active())
+        self.core.queue_bottom(self.tids[0])
+        self.assertTrue(self.core.queue_event.active())
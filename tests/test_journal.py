@@ -0,0 +1,131 @@
+#
+# test_journal.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import shutil
+import tempfile
+import unittest
+
+try:
+    from journal import QueueJournal
+except ImportError as e:
+    # Needs deluge and twisted
+    raise unittest.SkipTest(str(e))
+
+def tid(n):
+    return "%040x" % n
+
+class QueueJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def journal(self):
+        return QueueJournal(self.dir, flush_delay=3600)
+
+    def crash(self, journal):
+        """Leave the journal behind as a killed daemon would"""
+        journal.f.flush()
+        if journal.flush_timer is not None and journal.flush_timer.active():
+            journal.flush_timer.cancel()
+        journal.f.close()
+
+    def mutate(self, rq):
+        rq.insert([tid(1), tid(2)])
+        rq.insert([tid(3)])
+        rq.insert([tid(4)], 0)
+        rq.extend(1, [tid(5)])
+        rq.move(tid(3), 0)
+        rq.discard(tid(2))
+
+    def test_replay_after_crash(self):
+        j = self.journal()
+        rq = j.load()
+        self.mutate(rq)
+        j.commit(rq)
+        self.crash(j)
+
+        j = self.journal()
+        copy = j.load()
+        self.assertEqual(list(copy), list(rq))
+        # Replayed into the snapshot, the next load starts after it
+        copy.discard(tid(4))
+        j.close(copy)
+        self.assertEqual(list(self.journal().load()), list(copy))
+
+    def test_fallback_and_close(self):
+        j = self.journal()
+        rq = j.load([[tid(1)], [tid(2)]])
+        self.assertEqual(list(rq), [[tid(1)], [tid(2)]])
+        rq.move(tid(2), 0)
+        j.close(rq)
+        self.assertEqual(list(self.journal().load()), [[tid(2)], [tid(1)]])
+
+    def test_torn_entry(self):
+        j = self.journal()
+        rq = j.load([[tid(1)]])
+        self.crash(j)
+        # The daemon died in the middle of the first entry
+        with open(j.journal_file, "a") as f:
+            f.write('[1, "insert", [["aaaa')
+
+        j = self.journal()
+        rq = j.load()
+        self.assertEqual(list(rq), [[tid(1)]])
+        rq.insert([tid(2)])
+        j.commit(rq)
+        self.crash(j)
+        self.assertEqual(list(self.journal().load()), [[tid(1)], [tid(2)]])
+
+    def test_rotate_keeps_old_journal(self):
+        j = self.journal()
+        rq = j.load()
+        rq.insert([tid(1)])
+        j.commit(rq)
+        # A compaction which failed after the rotation
+        j.rotate(rq)
+        rq.insert([tid(2)])
+        j.commit(rq)
+        j.rotate(rq)
+        rq.insert([tid(3)])
+        j.commit(rq)
+        self.crash(j)
+        self.assertEqual(list(self.journal().load()), [[tid(1)], [tid(2)], [tid(3)]])
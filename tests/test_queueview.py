@@ -0,0 +1,95 @@
+#
+# test_queueview.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+import unittest
+
+try:
+    from statuscache import StatusCache
+except ImportError as e:
+    # Needs deluge and twisted
+    raise unittest.SkipTest(str(e))
+
+from queueview import QueueView
+from removequeue import RemoveQueue
+from snapshot import PrioritySnapshot
+
+def tid(n):
+    return "%040x" % n
+
+class QueueViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.torrents = {}
+        self.names = {}
+        read = lambda i, fields: {"name": self.names[i]}
+        read_many = lambda ids, fields: dict((i, read(i, fields)) for i in ids)
+        self.rq = RemoveQueue()
+        snapshot = PrioritySnapshot(self.rq)
+        self.rq.listeners.append(snapshot)
+        self.view = QueueView(self.rq, snapshot, StatusCache(self.torrents, read, read_many))
+
+    def add(self, n, name, group=None):
+        self.torrents[tid(n)] = self.names[tid(n)] = name
+        self.rq.insert([tid(n)], group)
+
+    def test_search_in_queue_order(self):
+        # Queued in a different order than the ids were first seen
+        self.add(1, "a")
+        self.add(2, "b")
+        self.add(3, "c", 0)
+        page = self.view.page(search="x", sort="priority")
+        self.assertEqual(page["ids"], [])
+        page = self.view.page(search="", sort="name")
+        self.assertEqual(page["ids"], [tid(1), tid(2), tid(3)])
+        for n in (1, 2, 3):
+            self.view.status.store(tid(n), {"name": "same"})
+        page = self.view.page(search="sa", sort="priority")
+        self.assertEqual(page["ids"], [tid(3), tid(1), tid(2)])
+        self.assertEqual([page["rows"][i]["priority"] for i in page["ids"]], [0, 1, 2])
+        page = self.view.page(search="sa", sort="name")
+        self.assertEqual(page["ids"], [tid(3), tid(1), tid(2)])
+
+    def test_not_in_session(self):
+        # Queued torrents not loaded yet have no status
+        self.add(1, "a")
+        self.rq.insert([tid(2)])
+        page = self.view.page(search="a")
+        self.assertEqual(page["ids"], [tid(1)])
+        page = self.view.page(sort="name")
+        self.assertEqual(page["ids"], [tid(2), tid(1)])
+        self.assertEqual(page["rows"][tid(2)]["name"], None)
@@ -0,0 +1,85 @@
+#
+# test_reclaim.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from reclaim import ReclaimIndex
+except ImportError as e:
+    # Needs deluge and twisted
+    raise unittest.SkipTest(str(e))
+
+class ReclaimIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = {}
+        self.index = ReclaimIndex(lambda tid: self.files[tid])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def add(self, tid, name, link_to=None):
+        path = os.path.join(self.dir, name)
+        if link_to is None:
+            with open(path, "wb") as f:
+                f.write(b"x" * 65536)
+        else:
+            os.link(os.path.join(self.dir, link_to), path)
+        self.files[tid] = [path]
+        self.index.index(tid)
+
+    def test_hard_links(self):
+        self.add("a", "a")
+        self.add("b", "b", link_to="a")
+        size = self.index.reclaimable(["a", "b"])
+        self.assertTrue(size > 0)
+        self.assertEqual(self.index.reclaimable(["a"]), 0)
+        self.assertEqual(self.index.reclaimable(["b"]), 0)
+
+        # a is removed and its data deleted
+        shared = self.index.sharing("a")
+        self.assertEqual(shared, set(["b"]))
+        self.index.unindex("a")
+        os.remove(self.files["a"][0])
+        self.index.refresh(shared)
+        self.assertEqual(self.index.reclaimable(["b"]), size)
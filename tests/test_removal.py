@@ -0,0 +1,194 @@
+#
+# test_removal.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import removal
+    from removal import RateLimit, RemovalPipeline, delete_files
+except ImportError as e:
+    # Needs deluge and twisted
+    raise unittest.SkipTest(str(e))
+
+def tid(n):
+    return "%040x" % n
+
+class FakeCall(object):
+
+    def __init__(self, f, args):
+        self.f = f
+        self.args = args
+        self.cancelled = False
+
+    def active(self):
+        return not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
+
+class FakeReactor(object):
+    """Runs what the pipeline sends to the reactor right away, timers never"""
+
+    def callLater(self, delay, f, *args):
+        return FakeCall(f, args)
+
+    def callFromThread(self, f, *args):
+        f(*args)
+
+class FakeThreads(object):
+
+    def deferToThread(self, f, *args):
+        return removal.defer.maybeDeferred(f, *args)
+
+class RemovalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.save_path = os.path.join(self.dir, "data")
+        os.mkdir(self.save_path)
+        self.reactor, removal.reactor = removal.reactor, FakeReactor()
+        self.threads, removal.threads = removal.threads, FakeThreads()
+        self.detached = []
+        self.pipeline = RemovalPipeline(
+            os.path.join(self.dir, "deleting"), self.detached.append,
+            gentle=(1000, 1e12))
+
+    def tearDown(self):
+        removal.reactor = self.reactor
+        removal.threads = self.threads
+        shutil.rmtree(self.dir)
+
+    def write(self, name, size):
+        path = os.path.join(self.save_path, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def gentle(self):
+        return 1000, RateLimit(1e12)
+
+    def test_symlink_only_unlinked(self):
+        target = os.path.join(self.dir, "target")
+        with open(target, "wb") as f:
+            f.write(b"x" * 5000)
+        link = os.path.join(self.save_path, "t", "link")
+        os.mkdir(os.path.dirname(link))
+        os.symlink(target, link)
+        delete_files(self.save_path, [link], gentle=self.gentle(), progress=lambda c, n: None)
+        self.assertFalse(os.path.lexists(link))
+        self.assertFalse(os.path.exists(os.path.dirname(link)))
+        self.assertEqual(os.path.getsize(target), 5000)
+
+    def test_hard_link_not_truncated(self):
+        path = self.write("t/file", 5000)
+        other = os.path.join(self.dir, "other")
+        os.link(path, other)
+        freed = []
+        delete_files(self.save_path, [path], gentle=self.gentle(), progress=lambda c, n: freed.append(n))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(os.path.getsize(other), 5000)
+        self.assertEqual(sum(freed), 0)
+
+    def test_shrink_updates_reclaimed(self):
+        paths = [self.write("t/a", 10500), self.write("t/b", 500)]
+        d = self.pipeline.remove(tid(1), self.save_path, paths, 20000, 1)
+        job = self.pipeline.jobs[tid(1)]
+        saved = []
+        progress = self.pipeline.progress
+        def record(job, cursor, freed):
+            progress(job, cursor, freed)
+            saved.append((job["cursor"], job["reclaimed"], self.pipeline.save_timer is not None))
+        self.pipeline.progress = record
+        self.assertEqual(self.detached, [])
+        self.pipeline.flush()
+        self.assertEqual(self.detached, [tid(1)])
+        self.assertEqual(d.result, tid(1))
+        self.assertEqual([s[1] for s in saved if s[1]][:3], [1000, 2000, 3000])
+        self.assertEqual(job["reclaimed"], 10000)
+        self.assertEqual(job["cursor"], 2)
+        self.assertTrue(all(s[2] for s in saved))
+        self.assertEqual(self.pipeline.jobs, {})
+        self.assertFalse(os.path.exists(os.path.join(self.save_path, "t")))
+
+    def test_resume_from_cursor(self):
+        paths = [self.write("t/a", 100), self.write("t/b", 100), self.write("t/c", 100)]
+        jobs = [{
+            "torrent_id": tid(n), "save_path": self.save_path, "paths": paths[n:n + 1] + paths[2:],
+            "size": 200, "device": 1, "cursor": 1, "reclaimed": 0,
+        } for n in (0, 1)]
+        with open(self.pipeline.state_file, "w") as f:
+            json.dump(jobs, f)
+        self.pipeline.resume(set([tid(1)]))
+        # Files before the cursor were deleted before the restart
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertFalse(os.path.exists(paths[2]))
+        # Still in the session, removed from it first
+        self.assertEqual(self.detached, [tid(1)])
+        self.assertEqual(self.pipeline.jobs, {})
+
+    def test_concurrency(self):
+        running = []
+        class PendingThreads(object):
+            def deferToThread(self, f, *args):
+                d = removal.defer.Deferred()
+                running.append(d)
+                return d
+        removal.threads = PendingThreads()
+        self.pipeline.set_concurrency(1)
+        done = [self.pipeline.remove(tid(n), self.save_path, [], 0, 1) for n in range(4)]
+        self.pipeline.flush()
+        self.assertEqual(len(running), 1)
+        self.pipeline.set_concurrency(3)
+        self.assertEqual(len(running), 3)
+        running[0].callback(None)
+        self.assertEqual(len(running), 4)
+        self.assertEqual(done[0].result, tid(0))
+        self.pipeline.set_concurrency(1)
+        for d in running[1:3]:
+            d.callback(None)
+        self.assertEqual(self.pipeline.active, 1)
+        running[3].callback(None)
+        self.assertEqual(self.pipeline.active, 0)
+        self.assertEqual([d.result for d in done], [tid(n) for n in range(4)])
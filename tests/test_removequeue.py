@@ -0,0 +1,186 @@
+#
+# test_removequeue.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import random
+import unittest
+
+from removequeue import RemoveQueue
+
+def tid(n):
+    return "%040x" % n
+
+class Model(object):
+    """The queue as a plain list of lists, the semantics RemoveQueue must keep"""
+
+    def __init__(self):
+        self.groups = []
+
+    def __contains__(self, t):
+        return any(t in g for g in self.groups)
+
+    def insert(self, tids, pos=None):
+        added = []
+        for i in tids:
+            if i not in self and i not in added:
+                added.append(i)
+        if added:
+            pos = len(self.groups) if pos is None else max(0, min(pos, len(self.groups)))
+            self.groups.insert(pos, added)
+        return added
+
+    def extend(self, pos, tids):
+        if pos < 0 or pos >= len(self.groups):
+            return self.insert(tids, 0 if pos < 0 else None)
+        added = []
+        for i in tids:
+            if i not in self and i not in added:
+                added.append(i)
+        self.groups[pos].extend(added)
+        return added
+
+    def discard(self, t):
+        for g in self.groups:
+            if t in g:
+                g.remove(t)
+                if not g:
+                    self.groups.remove(g)
+                return True
+        return False
+
+    def move(self, t, pos):
+        g = [g for g in self.groups if t in g][0]
+        self.groups.remove(g)
+        self.groups.insert(max(0, min(pos, len(self.groups))), g)
+
+def check_tree(test, rq):
+    """Parent pointers, sizes and totals of every node"""
+    def walk(node, parent):
+        if node is None:
+            return 0, 0
+        test.assertIs(node.parent, parent)
+        ls, lt = walk(node.left, node)
+        rs, rt = walk(node.right, node)
+        test.assertEqual(node.size, ls + rs + 1)
+        test.assertEqual(node.total, lt + rt + len(node.members))
+        return node.size, node.total
+    walk(rq.root, None)
+
+class RemoveQueueTest(unittest.TestCase):
+
+    def assertSame(self, rq, model):
+        check_tree(self, rq)
+        self.assertEqual(list(rq), model.groups)
+        self.assertEqual(len(rq), len(model.groups))
+        count = sum(len(g) for g in model.groups)
+        self.assertEqual(rq.torrent_count(), count)
+        for pos, g in enumerate(model.groups):
+            self.assertEqual(rq.group(pos), g)
+            for i in g:
+                self.assertEqual(rq.priority(i), pos)
+        flat = [(i, pos) for pos, g in enumerate(model.groups) for i in g]
+        self.assertEqual(rq.page(0, count + 1), flat)
+        if count:
+            offset = count // 3
+            self.assertEqual(rq.page(offset, 5), flat[offset:offset + 5])
+
+    def test_random_operations(self):
+        rnd = random.Random(1)
+        for seed in range(20):
+            rq, model = RemoveQueue(), Model()
+            for step in range(300):
+                n = len(model.groups)
+                queued = [i for g in model.groups for i in g]
+                op = rnd.random()
+                if op < 0.35 or not queued:
+                    tids = [tid(rnd.randrange(200)) for i in range(rnd.randint(1, 4))]
+                    pos = rnd.choice([None, rnd.randint(-2, n + 2)])
+                    self.assertEqual(rq.insert(tids, pos), model.insert(tids, pos))
+                elif op < 0.55:
+                    tids = [tid(rnd.randrange(200)) for i in range(rnd.randint(1, 3))]
+                    pos = rnd.randint(-1, n)
+                    self.assertEqual(rq.extend(pos, tids), model.extend(pos, tids))
+                elif op < 0.8:
+                    t = rnd.choice(queued + [tid(999)])
+                    self.assertEqual(rq.discard(t), model.discard(t))
+                else:
+                    t = rnd.choice(queued)
+                    pos = rnd.randint(-1, n + 1)
+                    rq.move(t, pos)
+                    model.move(t, pos)
+                if step % 10 == 0:
+                    self.assertSame(rq, model)
+            self.assertSame(rq, model)
+
+    def test_pack_unpack(self):
+        rq = RemoveQueue([[tid(1), tid(2)], [tid(3)], [tid(4), tid(5), tid(6)]])
+        rq.discard(tid(3))
+        rq.move(tid(4), 0)
+        copy = RemoveQueue.unpack(*rq.pack())
+        check_tree(self, copy)
+        self.assertEqual(list(copy), list(rq))
+        # Mutations keep working on an unpacked queue
+        model = Model()
+        model.groups = list(copy)
+        copy.move(tid(1), 0)
+        model.move(tid(1), 0)
+        copy.insert([tid(7)], 1)
+        model.insert([tid(7)], 1)
+        self.assertSame(copy, model)
+
+    def test_unpack_skips_duplicates(self):
+        rq = RemoveQueue([[tid(1)], [tid(2)]])
+        data, sizes = rq.pack()
+        copy = RemoveQueue.unpack(data + data[:20], sizes + [1])
+        self.assertEqual(list(copy), [[tid(1)], [tid(2)]])
+
+    def test_listeners(self):
+        rq = RemoveQueue()
+        ops = []
+        rq.listeners.append(lambda op, args: ops.append((op, args)))
+        rq.insert([tid(1), tid(1)])
+        rq.insert([tid(1)])
+        rq.extend(0, [tid(2)])
+        rq.move(tid(2), 3)
+        rq.discard(tid(1))
+        self.assertEqual(ops, [
+            ("insert", [[tid(1)], 0]),
+            ("extend", [0, [tid(2)]]),
+            ("move", [tid(2), 3]),
+            ("discard", [tid(1)]),
+        ])
@@ -0,0 +1,155 @@
+#
+# test_rules.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+import time
+import unittest
+
+try:
+    import rules
+    from rules import AutoEnqueue, Rule
+    from statuscache import StatusCache
+except ImportError as e:
+    # Needs deluge and twisted
+    raise unittest.SkipTest(str(e))
+
+def tid(n):
+    return "%040x" % n
+
+class FakeTime(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+class RuleTest(unittest.TestCase):
+
+    def test_matches(self):
+        rule = Rule({"name": "r", "ratio": 2, "tracker": r"example\.org$", "position": 3})
+        self.assertEqual(rule.fields, set(["ratio", "tracker_host"]))
+        self.assertEqual(rule.position, 3)
+        status = {"ratio": 2.5, "tracker_host": "tracker.example.org"}
+        self.assertTrue(rule.matches(status.get))
+        status["ratio"] = None
+        self.assertFalse(rule.matches(status.get))
+
+    def test_invalid(self):
+        for d in (
+            {"ratio": 0, "position": "middle"},
+            {"ratio": 0, "position": -1},
+            {"ratio": 0, "position": True},
+            {"ratio": "2"},
+            {"seeding_time": None},
+            {"completed_before": False},
+            {"tracker": 1},
+            {"size": 1},
+        ):
+            self.assertRaises(ValueError, Rule, d)
+
+class AutoEnqueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = {}
+        read = lambda i, fields: self.session[i]
+        read_many = lambda ids, fields: dict((i, self.session[i]) for i in ids)
+        self.status = StatusCache(self.session, read, read_many)
+        self.queue = []
+        self.auto = AutoEnqueue(
+            [{"name": "bad", "ratio": 0, "position": "middle"},
+             {"name": "seeded", "ratio": 1},
+             {"name": "old", "completed_before": 60}],
+            self.status,
+            lambda i: i in self.queue,
+            lambda i, rule: self.queue.append(i)
+        )
+        self.status.listeners.append(self.auto.on_change)
+
+    def update(self, n, **status):
+        self.session.setdefault(tid(n), {}).update(status)
+        self.status.store(tid(n), self.session[tid(n)])
+
+    def test_rules(self):
+        self.assertEqual([r.name for r in self.auto.rules], ["seeded", "old"])
+        self.update(1, ratio=0.5)
+        self.assertEqual(self.queue, [])
+        self.update(1, ratio=1.5)
+        self.assertEqual(self.queue, [tid(1)])
+
+    def test_exclude(self):
+        self.update(1, ratio=0.5)
+        self.auto.exclude(tid(1))
+        self.update(1, ratio=2)
+        self.assertEqual(self.queue, [])
+        self.auto.forget(tid(1))
+        self.update(1, ratio=3)
+        self.assertEqual(self.queue, [tid(1)])
+        # Nothing to keep out of the queue without rules
+        self.auto.set_rules([])
+        self.auto.exclude(tid(2))
+        self.assertEqual(self.auto.excluded, set())
+        self.auto.set_rules([{"ratio": 1}])
+        self.auto.exclude(tid(2))
+        self.auto.exclude(tid(3))
+        self.auto.prune([tid(3)])
+        self.assertEqual(self.auto.excluded, set([tid(3)]))
+
+    def test_tick(self):
+        now = time.time()
+        self.update(1, completed_time=now - 30)
+        self.update(2, completed_time=now - 90)
+        self.assertEqual(self.queue, [tid(2)])
+        self.auto.tick()
+        self.assertEqual(self.queue, [tid(2)])
+        # A minute later
+        clock = rules.time
+        rules.time = FakeTime(now + 60)
+        try:
+            self.auto.tick()
+        finally:
+            rules.time = clock
+        self.assertEqual(self.queue, [tid(2), tid(1)])
+        self.assertEqual(self.auto.due, [])
+
+    def test_failing_listener(self):
+        def fail(tid, changed):
+            raise RuntimeError("listener")
+        self.status.listeners.insert(0, fail)
+        self.update(1, ratio=2)
+        self.assertEqual(self.status.get(tid(1), "ratio"), 2)
+        self.assertEqual(self.queue, [tid(1)])
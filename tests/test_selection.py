@@ -0,0 +1,85 @@
+#
+# test_selection.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+import itertools
+import random
+import time
+import unittest
+
+from selection import select_groups
+
+def cheapest(candidates, need):
+    """Lowest cost of a cover, by trying every subset"""
+    best = None
+    for n in range(len(candidates) + 1):
+        for chosen in itertools.combinations(candidates, n):
+            if sum(c[1] for c in chosen) >= need:
+                cost = sum(c[2] for c in chosen)
+                if best is None or cost < best:
+                    best = cost
+    return best
+
+class SelectGroupsTest(unittest.TestCase):
+
+    def test_exhaustive(self):
+        rnd = random.Random(3)
+        for step in range(300):
+            candidates = [(k, rnd.randint(0, 20), rnd.randint(0, 30)) for k in range(rnd.randint(1, 9))]
+            need = rnd.randint(1, 100)
+            chosen = select_groups(candidates, need)
+            cost = cheapest(candidates, need)
+            if cost is None:
+                self.assertEqual(chosen, [c[0] for c in candidates])
+                continue
+            self.assertEqual(len(set(chosen)), len(chosen))
+            picked = [c for c in candidates if c[0] in chosen]
+            self.assertTrue(sum(c[1] for c in picked) >= need)
+            self.assertEqual(sum(c[2] for c in picked), cost)
+
+    def test_nothing_needed(self):
+        self.assertEqual(select_groups([("a", 1, 1)], 0), [])
+
+    def test_large_window(self):
+        rnd = random.Random(4)
+        candidates = [(k, rnd.randint(1, 1000), rnd.randint(1, 1000)) for k in range(3000)]
+        need = sum(c[1] for c in candidates) // 2
+        start = time.time()
+        chosen = select_groups(candidates, need)
+        self.assertTrue(time.time() - start < 5)
+        sizes = dict((c[0], c[1]) for c in candidates)
+        self.assertTrue(sum(sizes[k] for k in chosen) >= need)
@@ -0,0 +1,106 @@
+#
+# test_snapshot.py
+#
+# Copyright (C) 2013 Tydus <Tydus@Tydus.org>
+#
+# Basic plugin template created by:
+# Copyright (C) 2008 Martijn Voncken <mvoncken@gmail.com>
+# Copyright (C) 2007-2009 Andrew Resch <andrewresch@gmail.com>
+# Copyright (C) 2009 Damien Churchill <damoxc@gmail.com>
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+
+import random
+import unittest
+
+from removequeue import RemoveQueue
+from snapshot import PrioritySnapshot
+
+def tid(n):
+    return "%040x" % n
+
+class PrioritySnapshotTest(unittest.TestCase):
+
+    def apply(self, known, delta):
+        if delta["full"]:
+            known.clear()
+        for i, rp in delta["priorities"].items():
+            if rp is None:
+                known.pop(i, None)
+            else:
+                known[i] = rp
+
+    def test_deltas(self):
+        rnd = random.Random(2)
+        rq = RemoveQueue()
+        snapshot = PrioritySnapshot(rq)
+        rq.listeners.append(snapshot)
+        # Clients polling at different paces
+        clients = [[None, {}] for i in range(3)]
+        for step in range(2000):
+            queued = [i for g in rq for i in g]
+            op = rnd.random()
+            if op < 0.4 or not queued:
+                rq.insert([tid(rnd.randrange(300))], rnd.choice([None, rnd.randint(0, len(rq))]))
+            elif op < 0.55:
+                rq.extend(rnd.randint(0, len(rq)), [tid(rnd.randrange(300))])
+            elif op < 0.75:
+                rq.discard(rnd.choice(queued))
+            else:
+                rq.move(rnd.choice(queued), rnd.randint(0, len(rq)))
+            if rnd.random() < 0.5:
+                snapshot.invalidate()
+            for n, client in enumerate(clients):
+                if rnd.random() < 0.3 / (n + 1):
+                    delta = snapshot.since(client[0])
+                    self.apply(client[1], delta)
+                    client[0] = delta["version"]
+                    full = dict((i, rp) for rp, g in enumerate(rq) for i in g)
+                    self.assertEqual(client[1], full)
+                    for i in list(full)[:5]:
+                        self.assertEqual(snapshot.get(i), full[i])
+        self.assertEqual(snapshot.get(tid(999)), "")
+
+    def test_horizon(self):
+        rq = RemoveQueue()
+        snapshot = PrioritySnapshot(rq)
+        snapshot.max_log = 3
+        rq.listeners.append(snapshot)
+        rq.insert([tid(1)])
+        version = snapshot.since()["version"]
+        for n in range(2, 7):
+            rq.insert([tid(n)])
+            snapshot.invalidate()
+        self.assertTrue(snapshot.since(version)["full"])
+        recent = snapshot.version - 2
+        delta = snapshot.since(recent)
+        self.assertFalse(delta["full"])
+        self.assertEqual(delta["priorities"], {tid(5): 4, tid(6): 5})
+        self.assertEqual(snapshot.since(snapshot.version)["priorities"], {})